@@ -0,0 +1,388 @@
+#coding: utf-8
+"""
+In-process fake of the DigitalOcean v2 API, for benchmarks.
+
+It serves a generated fleet of droplets, domain records and floating IPs,
+with pagination, ETags, the RateLimit-* headers, optional latency, slow
+request, 429 and per-route error injection, and actions that complete after
+a configurable delay. The tests use it too.
+
+    >>> server = FakeServer(droplets=5000, latency=0.005).start()
+    >>> do = DoManager(None, 'token', 2, api_endpoint=server.endpoint)
+"""
+
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs, urlparse
+
+MAX_PER_PAGE = 200
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Fleet(object):
+    def __init__(self, droplets, records, floating_ips, action_delay):
+        self.lock = threading.Lock()
+        self.action_delay = action_delay
+        self.ids = itertools.count(1)
+        self.action_ids = itertools.count(1)
+        self.droplets = {}
+        self.actions = {}
+        for index in range(droplets):
+            droplet = self.droplet('node-%d' % index, tags=['web' if index % 2 else 'db'])
+            self.droplets[droplet['id']] = droplet
+        self.records = dict((id, {
+            'id': id, 'type': 'A', 'name': 'host-%d' % id,
+            'data': '10.0.%d.%d' % (id // 250, id % 250), 'priority': None,
+            'port': None, 'ttl': 1800, 'weight': None, 'flags': None, 'tag': None,
+        }) for id in range(1, records + 1))
+        droplet_ids = sorted(self.droplets)
+        self.floating_ips = dict(('45.55.%d.%d' % (index // 250, index % 250), {
+            'ip': '45.55.%d.%d' % (index // 250, index % 250),
+            'droplet': {'id': droplet_ids[index]} if index < len(droplet_ids) else None,
+            'region': {'slug': 'nyc3'}, 'locked': False,
+        }) for index in range(floating_ips))
+
+    def droplet(self, name, tags=(), ready=True):
+        id = next(self.ids)
+        networks = {'v4': [], 'v6': []}
+        if ready:
+            networks = self.networks(id)
+        return {
+            'id': id, 'name': name, 'memory': 1024, 'vcpus': 1, 'disk': 25,
+            'locked': False, 'status': 'active' if ready else 'new',
+            'kernel': None, 'created_at': '2016-01-01T00:00:00Z',
+            'features': ['virtio'], 'backup_ids': [], 'snapshot_ids': [],
+            'image': {'id': 1, 'name': '16.04 x64', 'distribution': 'Ubuntu',
+                      'slug': 'ubuntu-16-04-x64', 'public': True,
+                      'regions': ['nyc3', 'ams3'], 'type': 'snapshot'},
+            'size_slug': '1gb', 'networks': networks,
+            'region': {'name': 'New York 3', 'slug': 'nyc3', 'available': True,
+                       'features': ['private_networking', 'backups', 'ipv6']},
+            'tags': list(tags),
+        }
+
+    @staticmethod
+    def networks(id):
+        return {'v4': [
+            {'ip_address': '104.%d.%d.%d' % (id >> 16 & 255, id >> 8 & 255, id & 255),
+             'netmask': '255.255.240.0', 'gateway': '104.0.0.1', 'type': 'public'},
+            {'ip_address': '10.%d.%d.%d' % (id >> 16 & 255, id >> 8 & 255, id & 255),
+             'netmask': '255.255.0.0', 'gateway': '10.0.0.1', 'type': 'private'},
+        ], 'v6': []}
+
+    def action(self, type, resource_id, resource_type='droplet', on_complete=None):
+        id = next(self.action_ids)
+        action = {
+            'id': id, 'status': 'in-progress', 'type': type,
+            'started_at': time.time(), 'completed_at': None,
+            'resource_id': resource_id, 'resource_type': resource_type,
+            'region_slug': 'nyc3',
+        }
+        self.actions[id] = (action, on_complete)
+        return self.show_action(id)
+
+    def show_action(self, id):
+        action, on_complete = self.actions[id]
+        if action['status'] == 'in-progress' \
+                and time.time() >= action['started_at'] + self.action_delay:
+            action['status'] = 'completed'
+            action['completed_at'] = time.time()
+            if on_complete is not None:
+                on_complete()
+        return dict(action)
+
+    def create(self, name, tags):
+        droplet = self.droplet(name, tags, ready=False)
+        self.droplets[droplet['id']] = droplet
+
+        def boot():
+            droplet['status'] = 'active'
+            droplet['networks'] = self.networks(droplet['id'])
+
+        action = self.action('create', droplet['id'], on_complete=boot)
+        return droplet, action
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment, avoiding delayed-ACK stalls.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        server = self.server.fake
+        url = urlparse(self.path)
+        self.query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.body = json.loads(body.decode('utf-8')) if body.strip() else {}
+
+        number = server.count(method, url.path)
+        if server.latency:
+            time.sleep(server.latency)
+        if server.straggle_every and number % server.straggle_every == 0:
+            time.sleep(server.straggle_delay)
+        if server.throttled():
+            return self.reply(429, {'id': 'too_many_requests', 'message': 'API Rate limit exceeded.'},
+                              {'Retry-After': '0'})
+        status = server.errors.get((method, url.path.rstrip('/')))
+        if status:
+            return self.reply(status, {'id': 'server_error', 'message': 'Injected error.'})
+
+        for pattern, handlers in ROUTES:
+            match = pattern.match(url.path)
+            if match and method in handlers:
+                with server.fleet.lock:
+                    status, payload = handlers[method](self, server.fleet, *match.groups())
+                return self.reply(status, payload)
+        self.reply(404, {'id': 'not_found', 'message': 'The resource you were accessing could not be found.'})
+
+    def reply(self, status, payload, headers=None):
+        server = self.server.fake
+        body = b'' if status == 204 else json.dumps(payload).encode('utf-8')
+        headers = dict(headers or {}, **server.rate_limit_headers())
+        if self.command == 'GET' and status == 200:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        server.bytes_sent += len(body)
+
+    def page(self, key, items):
+        per_page = min(int(self.query.get('per_page', 20)), MAX_PER_PAGE)
+        page = int(self.query.get('page', 1))
+        total = len(items)
+        last = max(1, (total + per_page - 1) // per_page)
+        base = 'http://%s%s?' % (self.headers['Host'], urlparse(self.path).path)
+        extra = ''.join('&%s=%s' % (k, v) for k, v in sorted(self.query.items())
+                        if k not in ('page', 'per_page'))
+        link = lambda number: '%spage=%d&per_page=%d%s' % (base, number, per_page, extra)
+
+        pages = {}
+        if page > 1:
+            pages.update(first=link(1), prev=link(page - 1))
+        if page < last:
+            pages.update(next=link(page + 1), last=link(last))
+        start = (page - 1) * per_page
+        return 200, {key: items[start:start + per_page],
+                     'links': {'pages': pages}, 'meta': {'total': total}}
+
+
+def list_droplets(handler, fleet):
+    droplets = [fleet.droplets[id] for id in sorted(fleet.droplets)]
+    tag = handler.query.get('tag_name')
+    if tag:
+        droplets = [droplet for droplet in droplets if tag in droplet['tags']]
+    return handler.page('droplets', droplets)
+
+
+def create_droplets(handler, fleet):
+    body = handler.body
+    names = body.get('names') or [body['name']]
+    created = [fleet.create(name, body.get('tags') or []) for name in names]
+    links = {'actions': [{'id': action['id'], 'rel': 'create', 'href': ''}
+                         for droplet, action in created]}
+    if 'names' in body:
+        return 202, {'droplets': [droplet for droplet, action in created], 'links': links}
+    return 202, {'droplet': created[0][0], 'links': links}
+
+
+def show_droplet(handler, fleet, id):
+    droplet = fleet.droplets.get(int(id))
+    if droplet is None:
+        return 404, {'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}
+    return 200, {'droplet': droplet}
+
+
+def destroy_droplet(handler, fleet, id):
+    if fleet.droplets.pop(int(id), None) is not None:
+        fleet.action('destroy', int(id))
+    return 204, None
+
+
+def droplet_action(handler, fleet, id):
+    if int(id) not in fleet.droplets:
+        return 404, {'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}
+    return 201, {'action': fleet.action(handler.body['type'], int(id))}
+
+
+def tag_action(handler, fleet):
+    tag = handler.query.get('tag_name')
+    actions = [fleet.action(handler.body['type'], id)
+               for id in sorted(fleet.droplets) if tag in fleet.droplets[id]['tags']]
+    return 201, {'actions': actions}
+
+
+def list_tags(handler, fleet):
+    counts = {}
+    for droplet in fleet.droplets.values():
+        for tag in droplet['tags']:
+            counts[tag] = counts.get(tag, 0) + 1
+    return handler.page('tags', [{'name': tag, 'resources': {'droplets': {'count': counts[tag]}}}
+                                 for tag in sorted(counts)])
+
+
+def list_actions(handler, fleet):
+    actions = [fleet.show_action(id) for id in sorted(fleet.actions, reverse=True)]
+    return handler.page('actions', actions)
+
+
+def show_action(handler, fleet, id):
+    if int(id) not in fleet.actions:
+        return 404, {'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}
+    return 200, {'action': fleet.show_action(int(id))}
+
+
+def list_records(handler, fleet, domain):
+    return handler.page('domain_records', [fleet.records[id] for id in sorted(fleet.records)])
+
+
+def create_record(handler, fleet, domain):
+    id = max(fleet.records or [0]) + 1
+    record = dict({'id': id, 'name': '@', 'priority': None, 'port': None,
+                   'ttl': 1800, 'weight': None, 'flags': None, 'tag': None}, **handler.body)
+    # Like the API, refuse a CNAME sharing its name with any other record.
+    for other in fleet.records.values():
+        if other['name'] == record['name'] and 'CNAME' in (other['type'], record['type']):
+            return 422, {'id': 'unprocessable_entity',
+                         'message': 'CNAME records cannot share a name with other records.'}
+    fleet.records[id] = record
+    return 201, {'domain_record': record}
+
+
+def edit_record(handler, fleet, domain, id):
+    record = fleet.records[int(id)]
+    record.update(handler.query or handler.body)
+    return 200, {'domain_record': record}
+
+
+def destroy_record(handler, fleet, domain, id):
+    fleet.records.pop(int(id), None)
+    return 204, None
+
+
+def list_floating_ips(handler, fleet):
+    return handler.page('floating_ips', [fleet.floating_ips[ip] for ip in sorted(fleet.floating_ips)])
+
+
+def floating_ip_action(handler, fleet, ip):
+    floating_ip = fleet.floating_ips[ip]
+    if handler.body['type'] == 'assign':
+        floating_ip['droplet'] = {'id': int(handler.body['droplet_id'])}
+    else:
+        floating_ip['droplet'] = None
+    return 201, {'action': fleet.action(handler.body['type'], 0, 'floating_ip')}
+
+
+ROUTES = [(re.compile('^/v2%s/?$' % pattern), handlers) for pattern, handlers in [
+    ('/droplets', {'GET': list_droplets, 'POST': create_droplets}),
+    ('/droplets/actions', {'POST': tag_action}),
+    (r'/droplets/(\d+)', {'GET': show_droplet, 'DELETE': destroy_droplet}),
+    (r'/droplets/(\d+)/actions', {'POST': droplet_action}),
+    ('/tags', {'GET': list_tags}),
+    ('/actions', {'GET': list_actions}),
+    (r'/actions/(\d+)', {'GET': show_action}),
+    ('/domains/([^/]+)/records', {'GET': list_records, 'POST': create_record}),
+    (r'/domains/([^/]+)/records/(\d+)', {'PUT': edit_record, 'DELETE': destroy_record}),
+    ('/floating_ips', {'GET': list_floating_ips}),
+    ('/floating_ips/([^/]+)/actions', {'POST': floating_ip_action}),
+]]
+
+
+class FakeServer(object):
+    def __init__(self, droplets=100, records=100, floating_ips=10, latency=0.0,
+            action_delay=0.0, rate_limit=5000, rate_window=3600, throttle_every=0,
+            straggle_every=0, straggle_delay=0.5):
+        self.fleet = Fleet(droplets, records, floating_ips, action_delay)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        # Answer every n-th request with a 429, 0 for never.
+        self.throttle_every = throttle_every
+        # Hold every n-th request for straggle_delay more seconds, 0 for never.
+        self.straggle_every = straggle_every
+        self.straggle_delay = straggle_delay
+        # (method, path) -> status to answer with instead, e.g.
+        # {('GET', '/v2/droplets/1'): 500}
+        self.errors = {}
+        self.requests = {}  # (method, path) -> count
+        self.bytes_sent = 0
+        self._count_lock = threading.Lock()
+        self._total = 0
+        self._window_start = time.time()
+        self._window_requests = 0
+
+    def start(self):
+        self.httpd = ThreadingServer(('127.0.0.1', 0), Handler)
+        self.httpd.fake = self
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_port
+
+    @property
+    def total_requests(self):
+        return self._total
+
+    def count(self, method, path):
+        with self._count_lock:
+            key = (method, path)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._total += 1
+            now = time.time()
+            if now - self._window_start >= self.rate_window:
+                self._window_start, self._window_requests = now, 0
+            self._window_requests += 1
+            return self._total
+
+    def throttled(self):
+        return self.throttle_every and self._total % self.throttle_every == 0
+
+    def rate_limit_headers(self):
+        return {
+            'RateLimit-Limit': str(self.rate_limit),
+            'RateLimit-Remaining': str(max(self.rate_limit - self._window_requests, 0)),
+            'RateLimit-Reset': str(int(self._window_start + self.rate_window)),
+        }
@@ -0,0 +1,224 @@
+#coding: utf-8
+"""
+The fake v2 API of fakeserver.py served over HTTP/2 (and HTTP/1.1) by
+hypercorn, with gzip and brotli response compression, behind a proxy
+counting the bytes that cross the wire in both directions.
+
+    >>> server = H2FakeServer(droplets=5000, latency=0.005).start()
+    >>> do = DoManager(None, 'token', 2, api_endpoint=server.endpoint,
+    ...                transport=HttpxTransport(http1=False))
+    >>> server.wire_bytes
+
+Plain text HTTP/2 (h2c) is used, so clients need prior knowledge of it
+(HttpxTransport(http1=False)); HTTP/1.1 clients are served on the same port.
+Requires hypercorn, and brotli for br responses.
+"""
+
+import asyncio
+import gzip
+import json
+import socket
+import threading
+import time
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from fakeserver import ROUTES, Fleet, Handler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def compress(body, accept_encoding):
+    accepted = [coding.split(';')[0].strip() for coding in accept_encoding.split(',')]
+    if len(body) < 256:
+        return body, None
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=4), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(body, 6), 'gzip'
+    return body, None
+
+
+class Request(object):
+    # What the fakeserver handlers read from a request.
+    page = Handler.page
+
+    def __init__(self, path, query, body, headers):
+        self.path = path
+        self.query = query
+        self.body = body
+        self.headers = headers
+
+
+class H2FakeServer(object):
+    def __init__(self, droplets=100, records=100, floating_ips=10, latency=0.0,
+            action_delay=0.0):
+        self.fleet = Fleet(droplets, records, floating_ips, action_delay)
+        self.latency = latency
+        self.total_requests = 0
+        self.body_bytes = 0  # response bodies, as sent
+        self.wire_bytes = 0  # everything through the proxy, both ways
+        self.connections = 0  # accepted by the proxy
+        self._lock = threading.Lock()
+
+    async def app(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        headers = dict((key.decode('latin-1').title(), value.decode('latin-1'))
+                       for key, value in scope['headers'])
+        headers.setdefault('Host', headers.get(':Authority', '127.0.0.1'))
+        query = dict(pair.split('=', 1) for pair in
+                     scope['query_string'].decode('ascii').split('&') if '=' in pair)
+        request = Request(scope['path'], query, json.loads(body.decode('utf-8')) if body.strip() else {},
+                          headers)
+
+        with self._lock:
+            self.total_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        status, payload = 404, {'id': 'not_found', 'message': 'Not found.'}
+        for pattern, handlers in ROUTES:
+            match = pattern.match(scope['path'])
+            if match and scope['method'] in handlers:
+                with self.fleet.lock:
+                    status, payload = handlers[scope['method']](
+                        request, self.fleet, *match.groups())
+                break
+
+        content = b'' if status == 204 else json.dumps(payload).encode('utf-8')
+        content, encoding = compress(content, headers.get('Accept-Encoding', ''))
+        response_headers = [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(content)).encode('ascii'))]
+        if encoding:
+            response_headers.append((b'content-encoding', encoding.encode('ascii')))
+        with self._lock:
+            self.body_bytes += len(content)
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': response_headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def start(self):
+        self._stopping = None
+        port = free_port()
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            self._stopping = asyncio.Event()
+            config = Config()
+            config.bind = ['127.0.0.1:%d' % port]
+            config.accesslog = None
+            config.loglevel = 'WARNING'
+            loop.call_soon(started.set)
+            loop.run_until_complete(serve(self.app, config, shutdown_trigger=self._stopping.wait))
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        started.wait()
+        wait_for_port(port)
+        self._proxy = CountingProxy(port, self)
+        return self
+
+    def stop(self):
+        self._proxy.stop()
+        self._loop.call_soon_threadsafe(self._stopping.set)
+
+    @property
+    def endpoint(self):
+        return 'http://127.0.0.1:%d' % self._proxy.port
+
+
+class CountingProxy(object):
+    """
+    Forwards TCP connections to 127.0.0.1:port, adding the bytes relayed to
+    server.wire_bytes.
+    """
+    def __init__(self, port, server):
+        self.target = port
+        self.server = server
+        self.listener = socket.socket()
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(128)
+        self.port = self.listener.getsockname()[1]
+        thread = threading.Thread(target=self.accept)
+        thread.daemon = True
+        thread.start()
+
+    def accept(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target))
+            with self.server._lock:
+                self.server.connections += 1
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, target in ((client, upstream), (upstream, client)):
+                thread = threading.Thread(target=self.pump, args=(source, target))
+                thread.daemon = True
+                thread.start()
+
+    def pump(self, source, target):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                with self.server._lock:
+                    self.server.wire_bytes += len(data)
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def stop(self):
+        self.listener.close()
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_port(port, timeout=5.0):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.01)
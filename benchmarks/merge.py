@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+#coding: utf-8
+"""
+Compares the page merging of `paginated` with the extend loop it replaced.
+
+    python benchmarks/merge.py [records] [per_page]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dopy.manager import merge_pages
+
+
+def extend_merge(pages):
+    out = {}
+    for result in pages:
+        for key, value in result.items():
+            if key in out and isinstance(out[key], list):
+                out[key].extend(value)
+            else:
+                out[key] = value
+    return out
+
+
+def make_pages(records, per_page):
+    pages = []
+    for start in range(0, records, per_page):
+        pages.append({
+            'droplets': [{'id': i} for i in range(start, min(start + per_page, records))],
+            'links': {'pages': {}},
+            'meta': {'total': records},
+        })
+    return pages
+
+
+def measure(merge, records, per_page, rounds=7):
+    """
+    Best merge time over a few rounds, and the peak memory of one merge
+    (measured separately, tracemalloc slowing allocations down).
+    """
+    elapsed = None
+    for _ in range(rounds):
+        pages = make_pages(records, per_page)
+        started = time.perf_counter()
+        out = merge(pages)
+        took = time.perf_counter() - started
+        assert len(out['droplets']) == records
+        elapsed = took if elapsed is None else min(elapsed, took)
+
+    pages = make_pages(records, per_page)
+    tracemalloc.start()
+    merge(pages)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print('%d records, %d per page' % (records, per_page))
+    for name, merge in (('extend', extend_merge), ('merge_pages', merge_pages)):
+        elapsed, peak = measure(merge, records, per_page)
+        print('%-12s %8.2f ms  peak %8.1f KiB' % (name, elapsed * 1000, peak / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
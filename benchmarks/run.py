@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#coding: utf-8
+"""
+Times the main DoManager flows against the in-process fake API server.
+
+    python benchmarks/run.py                    # run and compare with baseline.json
+    python benchmarks/run.py --save             # record a new baseline
+    python benchmarks/run.py --droplets 20000 --latency 0.02 list_droplets
+
+Each flow reports its throughput (records or operations per second), the
+median time of a whole run over the repeats, latency percentiles over every
+request it issued, the number of those requests per run and its peak memory.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from dopy.manager import DoManager
+from fakeserver import FakeServer
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+DOMAIN = 'example.com'
+
+
+def list_droplets(do, server, options):
+    return len(do.all_active_droplets())
+
+
+def list_droplets_conditional(do, server, options):
+    # Served from the stored bodies after the first run (304s).
+    return len(do.all_active_droplets())
+
+
+def list_domain_records(do, server, options):
+    return len(do.all_domain_records(DOMAIN))
+
+
+def bulk_actions(do, server, options):
+    droplet_ids = sorted(server.fleet.droplets)[:options.batch]
+    results, errors = do.batch_droplet_action(droplet_ids, 'reboot')
+    assert not errors, errors
+    return len(results)
+
+
+def create_and_wait(do, server, options):
+    names = ['bench-%d-%d' % (time.time() * 1000, index) for index in range(options.batch // 10)]
+    json = do.request('/droplets', {'names': names, 'size': '1gb', 'image': 'ubuntu-16-04-x64',
+                                    'region': 'nyc3'}, method='POST')
+    do.wait_for_actions([action['id'] for action in json['links']['actions']], timeout=60)
+    return len(names)
+
+
+def throttled_listing(do, server, options):
+    return len(do.all_active_droplets())
+
+
+def show_droplets(do, server, options):
+    droplet_ids = sorted(server.fleet.droplets)[:options.batch]
+    for droplet_id in droplet_ids:
+        do.show_droplet(droplet_id)
+    return len(droplet_ids)
+
+
+# name -> (flow, FakeServer options, DoManager options)
+FLOWS = [
+    ('list_droplets', list_droplets, {}, {'validators': False}),
+    ('list_droplets_conditional', list_droplets_conditional, {}, {}),
+    ('list_domain_records', list_domain_records, {}, {'validators': False}),
+    ('bulk_actions', bulk_actions, {}, {'max_workers': 16, 'pool_size': 16}),
+    ('create_and_wait', create_and_wait, {'action_delay': 0.2}, {}),
+    ('throttled_listing', throttled_listing, {'throttle_every': 7},
+     {'validators': False, 'retry_backoff': 0.01}),
+    # One request in 25 takes 0.25s longer, hedged or not.
+    ('show_droplets_stragglers', show_droplets, {'straggle_every': 25, 'straggle_delay': 0.25},
+     {'validators': False}),
+    ('show_droplets_hedged', show_droplets, {'straggle_every': 25, 'straggle_delay': 0.25},
+     {'validators': False, 'hedge': True}),
+]
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def run_flow(flow, server_options, manager_options, options):
+    server = FakeServer(droplets=options.droplets, records=options.records,
+                        latency=options.latency, rate_limit=10 ** 6, rate_window=1,
+                        **server_options).start()
+    try:
+        manager_options = dict({'api_endpoint': server.endpoint}, **manager_options)
+        with DoManager(None, 'token', 2, **manager_options) as do:
+            flow(do, server, options)  # warm up connections and stored bodies
+            requests_before = server.total_requests
+
+            request_latencies = []
+            observer = lambda event: request_latencies.append(event.latency)
+            do.add_observer(observer)
+            durations, items = [], 0
+            for _ in range(options.repeat):
+                started = time.perf_counter()
+                items += flow(do, server, options)
+                durations.append(time.perf_counter() - started)
+            do.remove_observer(observer)
+            requests = (server.total_requests - requests_before) // options.repeat
+
+            # Separate run: tracemalloc slows allocations down.
+            tracemalloc.start()
+            flow(do, server, options)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        server.stop()
+
+    return {
+        'throughput': items / sum(durations),
+        'median': percentile(durations, 50),
+        'p50': percentile(request_latencies, 50),
+        'p95': percentile(request_latencies, 95),
+        'p99': percentile(request_latencies, 99),
+        'requests': requests,
+        'peak_kib': peak / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--droplets', type=int, default=5000)
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=200, help='droplets per bulk action')
+    parser.add_argument('--latency', type=float, default=0.002, help='injected seconds per request')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='relative slowdown of the median run or the request p99 '
+                             'reported as a regression')
+    parser.add_argument('flows', nargs='*', help='flows to run, all by default')
+    options = parser.parse_args()
+
+    results = {}
+    print('%-26s %10s %10s %9s %9s %9s %8s %10s' % (
+        'flow', 'items/s', 'median ms', 'req p50', 'req p95', 'req p99', 'requests',
+        'peak KiB'))
+    for name, flow, server_options, manager_options in FLOWS:
+        if options.flows and name not in options.flows:
+            continue
+        result = results[name] = run_flow(flow, server_options, manager_options, options)
+        print('%-26s %10.0f %10.1f %9.1f %9.1f %9.1f %8d %10.0f' % (
+            name, result['throughput'], result['median'] * 1000, result['p50'] * 1000,
+            result['p95'] * 1000, result['p99'] * 1000, result['requests'],
+            result['peak_kib']))
+
+    if options.save:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('baseline written to %s' % options.baseline)
+        return 0
+
+    if not os.path.exists(options.baseline):
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for name, result in sorted(results.items()):
+        for key in ('median', 'p99'):
+            if name in baseline and key in baseline[name] and \
+                    result[key] > baseline[name][key] * (1 + options.tolerance):
+                regressions += 1
+                print('REGRESSION %s: %s %.1f ms, baseline %.1f ms' % (
+                    name, key, result[key] * 1000, baseline[name][key] * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+#coding: utf-8
+"""
+Compares the transports on the wire: bytes, connections and latency of the
+same flows through requests over HTTP/1.1 without and with compression, and
+httpx over HTTP/2, against the local HTTP/2 fake server.
+
+    python benchmarks/transport.py
+    python benchmarks/transport.py --droplets 20000 --latency 0.02
+
+Needs hypercorn, httpx and h2 (brotli for br compression).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from dopy.manager import DoManager
+from dopy.transport import ACCEPT_ENCODING, HttpxTransport, RequestsTransport
+from h2server import H2FakeServer
+from run import percentile
+
+
+def identity_requests():
+    transport = RequestsTransport()
+    transport.session.headers['Accept-Encoding'] = 'identity'
+    return transport
+
+
+TRANSPORTS = [
+    ('requests http/1.1 identity', identity_requests),
+    ('requests http/1.1 %s' % ACCEPT_ENCODING.split(',')[0], RequestsTransport),
+    ('httpx http/2 %s' % ACCEPT_ENCODING.split(',')[0], lambda: HttpxTransport(http1=False)),
+]
+
+
+def list_droplets(do, server, options):
+    return len(do.all_active_droplets())
+
+
+def list_domain_records(do, server, options):
+    return len(do.all_domain_records('example.com'))
+
+
+def bulk_actions(do, server, options):
+    droplet_ids = sorted(server.fleet.droplets)[:options.batch]
+    results, errors = do.batch_droplet_action(droplet_ids, 'reboot')
+    assert not errors, errors
+    return len(results)
+
+
+FLOWS = [
+    ('list_droplets', list_droplets),
+    ('list_domain_records', list_domain_records),
+    ('bulk_actions', bulk_actions),
+]
+
+
+def run(flow, make_transport, options):
+    server = H2FakeServer(droplets=options.droplets, records=options.records,
+                          latency=options.latency).start()
+    try:
+        with DoManager(None, 'token', 2, api_endpoint=server.endpoint, validators=False,
+                       rate_limiter=False, max_workers=options.workers,
+                       pool_size=options.workers, transport=make_transport()) as do:
+            flow(do, server, options)  # warm up
+            do.transport.close()
+            do.transport = make_transport()
+            server.wire_bytes = server.connections = 0
+
+            latencies = []
+            for _ in range(options.repeat):
+                started = time.perf_counter()
+                flow(do, server, options)
+                latencies.append(time.perf_counter() - started)
+            do.transport.close()
+    finally:
+        server.stop()
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'wire_kib': server.wire_bytes / 1024.0 / options.repeat,
+        'connections': server.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--droplets', type=int, default=5000)
+    parser.add_argument('--records', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=200, help='droplets per bulk action')
+    parser.add_argument('--latency', type=float, default=0.005, help='injected seconds per request')
+    parser.add_argument('--workers', type=int, default=16, help='concurrent requests per call')
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+
+    print('%-22s %-30s %9s %9s %10s %6s' % (
+        'flow', 'transport', 'p50 ms', 'p95 ms', 'wire KiB', 'conns'))
+    for name, flow in FLOWS:
+        for transport_name, make_transport in TRANSPORTS:
+            result = run(flow, make_transport, options)
+            print('%-22s %-30s %9.1f %9.1f %10.1f %6d' % (
+                name, transport_name, result['p50'] * 1000, result['p95'] * 1000,
+                result['wire_kib'], result['connections']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,486 @@
+#coding: utf-8
+"""
+asyncio flavour of DoManager, for the v2 API only.
+
+Requires httpx (pip install dopy[async]) and Python 3.
+"""
+
+import asyncio
+import json as json_module
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .manager import (API_ENDPOINT, DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_WORKERS,
+                      DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, MAX_PER_PAGE, DoError, NotFound,
+                      is_listing, merge_pages, page_link, page_number, page_url)
+from .transport import ACCEPT_ENCODING
+
+
+async def iter_pages(fetch, url, max_workers=1):
+    """
+    Async counterpart of manager.iter_pages: yields every page of a listing,
+    in order, fetching the pages after the first concurrently.
+    """
+    result = await fetch(url)
+    yield result
+
+    nxt = page_link(result, 'next')
+    last = page_link(result, 'last')
+    if nxt and last and max_workers > 1:
+        first_number, last_number = page_number(nxt), page_number(last)
+        if first_number is not None and last_number is not None:
+            semaphore = asyncio.Semaphore(max_workers)
+
+            async def bounded(url):
+                async with semaphore:
+                    return await fetch(url)
+
+            urls = [page_url(last, number)
+                    for number in range(first_number, last_number + 1)]
+            for result in await asyncio.gather(*[bounded(url) for url in urls]):
+                yield result
+            return
+
+    while nxt is not None:
+        result = await fetch(nxt)
+        yield result
+        nxt = page_link(result, 'next')
+
+
+class AsyncDoManager(object):
+    def __init__(self, api_key, client=None, pool_size=DEFAULT_POOL_SIZE,
+            timeout=DEFAULT_TIMEOUT, api_endpoint=API_ENDPOINT,
+            max_workers=DEFAULT_MAX_WORKERS, per_page=MAX_PER_PAGE,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT, http2=False):
+        if httpx is None:
+            raise DoError('AsyncDoManager requires httpx, '
+                'install it with `pip install dopy[async]`.')
+
+        self.api_endpoint = api_endpoint + '/v2'
+        self.api_key = api_key
+        self.api_version = 2
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.per_page = per_page
+
+        self._owns_client = client is None
+        if client is None:
+            limits = httpx.Limits(max_connections=pool_size,
+                                  max_keepalive_connections=pool_size)
+            client = httpx.AsyncClient(
+                limits=limits, timeout=httpx.Timeout(timeout, connect=connect_timeout),
+                http2=http2, headers={'Accept-Encoding': ACCEPT_ENCODING})
+        self.client = client
+
+    async def close(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+#droplets=========================================
+    async def all_active_droplets(self, tag_name=None, per_page=None):
+        json = await self.request('/droplets/', self.list_params(tag_name, per_page))
+        for droplet in json['droplets']:
+            self.populate_droplet_ips(droplet)
+        return json['droplets']
+
+    async def iter_droplets(self, tag_name=None, per_page=None):
+        params = self.list_params(tag_name, per_page)
+        async for droplet in self.iter_collection('/droplets/', 'droplets', params):
+            self.populate_droplet_ips(droplet)
+            yield droplet
+
+    async def new_droplet(self, name, size_id, image_id, region_id,
+            ssh_key_ids=None, virtio=True, private_networking=False,
+            backups_enabled=False, user_data=None, ipv6=False):
+        params = {
+            'name': str(name),
+            'size': str(size_id),
+            'image': str(image_id),
+            'region': str(region_id),
+            'virtio': str(virtio).lower(),
+            'ipv6': str(ipv6).lower(),
+            'private_networking': str(private_networking).lower(),
+            'backups': str(backups_enabled).lower(),
+        }
+        if ssh_key_ids:
+            if isinstance(ssh_key_ids, str):
+                ssh_key_ids = [ssh_key_ids]
+            params['ssh_keys'] = [str(key_id) for key_id in ssh_key_ids]
+
+        if user_data:
+            params['user_data'] = user_data
+
+        json = await self.request('/droplets', params=params, method='POST')
+        return await self.show_droplet(json['droplet']['id'])
+
+    async def show_droplet(self, droplet_id):
+        json = await self.request('/droplets/%s' % droplet_id)
+        self.populate_droplet_ips(json['droplet'])
+        return json['droplet']
+
+    async def droplet_v2_action(self, droplet_id, droplet_type, params=None):
+        if params is None:
+            params = {}
+        params['type'] = droplet_type
+        json = await self.request('/droplets/%s/actions' % droplet_id, params=params, method='POST')
+        json.pop('status', None)
+        return json
+
+    async def reboot_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'reboot')
+
+    async def power_cycle_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'power_cycle')
+
+    async def shutdown_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'shutdown')
+
+    async def power_off_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'power_off')
+
+    async def power_on_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'power_on')
+
+    async def password_reset_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'password_reset')
+
+    async def resize_droplet(self, droplet_id, size_id):
+        return await self.droplet_v2_action(droplet_id, 'resize', {'size': size_id})
+
+    async def snapshot_droplet(self, droplet_id, name):
+        return await self.droplet_v2_action(droplet_id, 'snapshot', {'name': name})
+
+    async def restore_droplet(self, droplet_id, image_id):
+        return await self.droplet_v2_action(droplet_id, 'restore', {'image': image_id})
+
+    async def rebuild_droplet(self, droplet_id, image_id):
+        return await self.droplet_v2_action(droplet_id, 'rebuild', {'image': image_id})
+
+    async def enable_backups_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'enable_backups')
+
+    async def disable_backups_droplet(self, droplet_id):
+        return await self.droplet_v2_action(droplet_id, 'disable_backups')
+
+    async def rename_droplet(self, droplet_id, name):
+        return await self.droplet_v2_action(droplet_id, 'rename', {'name': name})
+
+    async def destroy_droplet(self, droplet_id, scrub_data=True):
+        json = await self.request('/droplets/%s' % droplet_id, method='DELETE')
+        json.pop('status', None)
+        return json
+
+    def populate_droplet_ips(self, droplet):
+        droplet[u'ip_address'] = ''
+        for network in droplet['networks']['v4']:
+            if network['type'] == 'public':
+                droplet[u'ip_address'] = network['ip_address']
+            if network['type'] == 'private':
+                droplet[u'private_ip_address'] = network['ip_address']
+
+#regions==========================================
+    async def all_regions(self):
+        json = await self.request('/regions/')
+        return json['regions']
+
+#images==========================================
+    async def all_images(self, filter='global'):
+        json = await self.request('/images/', {'filter': filter})
+        return json['images']
+
+    async def iter_images(self, filter='global'):
+        async for image in self.iter_collection('/images/', 'images', {'filter': filter}):
+            yield image
+
+    async def private_images(self):
+        json = await self.request('/images?private=true')
+        return json['images']
+
+    async def image_v2_action(self, image_id, image_type, params=None):
+        if params is None:
+            params = {}
+        params['type'] = image_type
+        json = await self.request('/images/%s/actions' % image_id, params=params, method='POST')
+        json.pop('status', None)
+        return json
+
+    async def show_image(self, image_id):
+        json = await self.request('/images/%s' % image_id)
+        return json['image']
+
+    async def destroy_image(self, image_id):
+        await self.request('/images/%s' % image_id, method='DELETE')
+        return True
+
+    async def transfer_image(self, image_id, region_id):
+        return await self.image_v2_action(image_id, 'transfer', {'region': region_id})
+
+#ssh_keys=========================================
+    async def all_ssh_keys(self):
+        json = await self.request('/account/keys')
+        return json['ssh_keys']
+
+    async def new_ssh_key(self, name, pub_key):
+        params = {'name': name, 'public_key': pub_key}
+        json = await self.request('/account/keys', params, method='POST')
+        return json['ssh_key']
+
+    async def show_ssh_key(self, key_id):
+        json = await self.request('/account/keys/%s/' % key_id)
+        return json['ssh_key']
+
+    async def edit_ssh_key(self, key_id, name, pub_key):
+        params = {'name': name} # v2 API doesn't allow to change key body now
+        json = await self.request('/account/keys/%s/' % key_id, params, method='PUT')
+        return json['ssh_key']
+
+    async def destroy_ssh_key(self, key_id):
+        await self.request('/account/keys/%s' % key_id, method='DELETE')
+        return True
+
+#sizes============================================
+    async def sizes(self):
+        json = await self.request('/sizes/')
+        return json['sizes']
+
+#domains==========================================
+    async def all_domains(self):
+        json = await self.request('/domains/')
+        return json['domains']
+
+    async def new_domain(self, name, ip):
+        params = {'name': name, 'ip_address': ip}
+        json = await self.request('/domains', params=params, method='POST')
+        return json['domain']
+
+    async def show_domain(self, domain_id):
+        json = await self.request('/domains/%s/' % domain_id)
+        return json['domain']
+
+    async def destroy_domain(self, domain_id):
+        await self.request('/domains/%s' % domain_id, method='DELETE')
+        return True
+
+    async def all_domain_records(self, domain_id):
+        json = await self.request('/domains/%s/records/' % domain_id)
+        return json['domain_records']
+
+    async def iter_domain_records(self, domain_id):
+        path = '/domains/%s/records/' % domain_id
+        async for record in self.iter_collection(path, 'domain_records'):
+            yield record
+
+    async def new_domain_record(self, domain_id, record_type, data, name=None, priority=None, port=None, weight=None):
+        params = {'type': record_type, 'data': data}
+        if name: params['name'] = name
+        if priority: params['priority'] = priority
+        if port: params['port'] = port
+        if weight: params['weight'] = weight
+
+        json = await self.request('/domains/%s/records/' % domain_id, params, method='POST')
+        return json['domain_record']
+
+    async def show_domain_record(self, domain_id, record_id):
+        json = await self.request('/domains/%s/records/%s' % (domain_id, record_id))
+        return json['domain_record']
+
+    async def edit_domain_record(self, domain_id, record_id, record_type, data, name=None, priority=None, port=None, weight=None):
+        params = {'name': name} # API v.2 allows only record name change
+        json = await self.request('/domains/%s/records/%s' % (domain_id, record_id), params, method='PUT')
+        return json['domain_record']
+
+    async def destroy_domain_record(self, domain_id, record_id):
+        await self.request('/domains/%s/records/%s' % (domain_id, record_id), method='DELETE')
+        return True
+
+#actions==========================================
+    async def show_all_actions(self):
+        json = await self.request('/actions')
+        return json['actions']
+
+    async def iter_actions(self):
+        async for action in self.iter_collection('/actions', 'actions'):
+            yield action
+
+    async def show_action(self, action_id):
+        json = await self.request('/actions/%s' % action_id)
+        return json['action']
+
+#floating_ips=====================================
+    async def all_floating_ips(self):
+        json = await self.request('/floating_ips')
+        return json['floating_ips']
+
+    async def new_floating_ip(self, droplet_id=None, region=None):
+        if droplet_id is not None and region is not None:
+            raise DoError('Only one of droplet_id and region is required to create a Floating IP. ' \
+                'Set one of the variables and try again.')
+        elif droplet_id is None and region is None:
+            raise DoError('droplet_id or region is required to create a Floating IP. ' \
+                'Set one of the variables and try again.')
+
+        if droplet_id is not None:
+            params = {'droplet_id': droplet_id}
+        else:
+            params = {'region': region}
+        json = await self.request('/floating_ips', params=params, method='POST')
+        return json['floating_ip']
+
+    async def destroy_floating_ip(self, ip_addr):
+        await self.request('/floating_ips/' + ip_addr, method='DELETE')
+
+    async def assign_floating_ip(self, ip_addr, droplet_id):
+        params = {'type': 'assign', 'droplet_id': droplet_id}
+        json = await self.request('/floating_ips/' + ip_addr + '/actions', params=params, method='POST')
+        return json['action']
+
+    async def unassign_floating_ip(self, ip_addr):
+        params = {'type': 'unassign'}
+        json = await self.request('/floating_ips/' + ip_addr + '/actions', params=params, method='POST')
+        return json['action']
+
+    async def list_floating_ip_actions(self, ip_addr):
+        json = await self.request('/floating_ips/' + ip_addr + '/actions')
+        return json['actions']
+
+    async def get_floating_ip_action(self, ip_addr, action_id):
+        json = await self.request('/floating_ips/%s/actions/%s' % (ip_addr, action_id))
+        return json['action']
+
+#tags=====================================
+    async def new_tag(self, name):
+        json = await self.request('/tags', params={'name': str(name)}, method='POST')
+        return json['tag']
+
+    async def show_tag(self, name):
+        json = await self.request('/tags/%s' % name)
+        return json['tag']
+
+    async def all_tags(self):
+        json = await self.request('/tags')
+        return json['tags']
+
+    async def edit_tag(self, current_name, new_name):
+        json = await self.request('/tags/%s' % current_name, params={'name': str(new_name)}, method='PUT')
+        return json['tag']
+
+    async def destroy_tag(self, name):
+        json = await self.request('/tags/%s' % name, method='DELETE')
+        json.pop('status', None)
+        return json
+
+    async def tag_resource(self, tag_name, resource_id, resource_type='droplet'):
+        params = {'resources': [{'resource_id': str(resource_id),
+                                 'resource_type': str(resource_type)}]}
+        json = await self.request('/tags/%s/resources' % tag_name, params=params, method='POST')
+        json.pop('status', None)
+        return json
+
+    async def untag_resource(self, tag_name, resource_id, resource_type='droplet'):
+        params = {'resources': [{'resource_id': str(resource_id),
+                                 'resource_type': str(resource_type)}]}
+        json = await self.request('/tags/%s/resources' % tag_name, params=params, method='DELETE')
+        json.pop('status', None)
+        return json
+
+#low_level========================================
+    async def request(self, path, params=None, method='GET'):
+        """
+        Sends a request and returns the decoded response; GET listings are
+        merged across all of their pages.
+        """
+        url = self.url(path)
+        if method != 'GET':
+            return await self.request_v2(url, params, method)
+        params = self.page_params(url, params)
+
+        async def fetch(page):
+            return await self.request_v2(page, params)
+
+        pages = [page async for page in iter_pages(fetch, url, self.max_workers)]
+        return merge_pages(pages)
+
+    async def iter_collection(self, path, key, params=None):
+        """
+        Yields the items listed under `key`, one page at a time.
+        """
+        url = self.url(path)
+        params = self.page_params(url, params)
+
+        async def fetch(page):
+            return await self.request_v2(page, params)
+
+        async for page in iter_pages(fetch, url):
+            for item in page.get(key, []):
+                yield item
+
+    def page_params(self, url, params):
+        params = dict(params or {})
+        if self.per_page and 'per_page' not in params and is_listing(url):
+            params['per_page'] = self.per_page
+        return params
+
+    def list_params(self, tag_name=None, per_page=None):
+        params = {}
+        if tag_name is not None:
+            params['tag_name'] = tag_name
+        if per_page is not None:
+            params['per_page'] = min(int(per_page), MAX_PER_PAGE)
+        return params
+
+    def url(self, path):
+        if not path.startswith('/'):
+            path = '/'+path
+        return self.api_endpoint+path
+
+    async def request_v2(self, url, params=None, method='GET'):
+        headers = {
+            'Authorization': "Bearer %s" % self.api_key,
+            'Content-Type': 'application/json',
+        }
+        params = params or {}
+
+        try:
+            if method in ('POST', 'DELETE', 'PUT'):
+                resp = await self.client.request(method, url, headers=headers,
+                    content=json_module.dumps(params))
+            elif method == 'GET':
+                # Keep the page query of `next` links alongside the params.
+                url = httpx.URL(url).copy_merge_params(params)
+                resp = await self.client.request(method, url, headers=headers)
+            else:
+                raise DoError('Unsupported method %s' % method)
+
+            if resp.status_code == 204:
+                json = {'status': resp.status_code}
+            else:
+                json = resp.json()
+
+        except ValueError:
+            raise ValueError("The API server doesn't respond with a valid json")
+        except httpx.HTTPError as e:
+            raise RuntimeError(e)
+
+        if resp.status_code >= 300:
+            error = NotFound if resp.status_code == 404 else DoError
+            if json:
+                if 'error_message' in json:
+                    raise error(json['error_message'])
+                elif 'message' in json:
+                    raise error(json['message'])
+            # The JSON reponse is bad, so raise an exception with the HTTP status
+            resp.raise_for_status()
+
+        if json.get('id') == 'not_found':
+            raise NotFound(json['message'])
+
+        return json
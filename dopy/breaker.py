@@ -0,0 +1,93 @@
+#coding: utf-8
+"""
+Circuit breakers, one per endpoint family (droplets, domains, actions...).
+
+After failure_threshold consecutive failures (connection errors, timeouts
+or 5xx responses) on a family, its requests fail at once with CircuitOpen
+instead of piling up on a dead endpoint. Every reset_timeout seconds one
+request is let through as a trial: if it succeeds the circuit closes, if
+it fails it stays open for another reset_timeout.
+"""
+
+import threading
+import time
+
+from .manager import DoError
+from .metrics import endpoint_family
+
+
+class CircuitOpen(DoError):
+    pass
+
+
+class CircuitBreaker(object):
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0  # consecutive
+        self.retry_at = None  # set while open: when the next trial may go
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.retry_at is not None
+
+    def allow(self):
+        """
+        Whether a request may be sent now.
+        """
+        with self._lock:
+            if self.retry_at is None:
+                return True
+            now = time.time()
+            if now < self.retry_at:
+                return False
+            # Let this one through as the trial; the others keep failing
+            # fast until it reports back, or for another reset_timeout.
+            self.retry_at = now + self.reset_timeout
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.retry_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.retry_at is not None or self.failures >= self.failure_threshold:
+                self.retry_at = time.time() + self.reset_timeout
+
+
+class CircuitBreakers(object):
+    """
+    The breakers of one DoManager, created on first use per family.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        family = endpoint_family(url)
+        breaker = self.breakers.get(family)
+        if breaker is None:
+            with self._lock:
+                breaker = self.breakers.setdefault(family, CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout))
+        return breaker
+
+    def check(self, url):
+        """
+        Returns the breaker for url, or raises CircuitOpen if it is open.
+        """
+        breaker = self.get(url)
+        if not breaker.allow():
+            retry_at = breaker.retry_at or time.time()
+            raise CircuitOpen('Too many failures on /%s, failing fast for %.0fs' % (
+                endpoint_family(url), max(0, retry_at - time.time())))
+        return breaker
+
+    def open_families(self):
+        return sorted(family for family, breaker in self.breakers.items() if breaker.is_open)
@@ -0,0 +1,202 @@
+#coding: utf-8
+"""
+Response cache for read-mostly GET endpoints.
+
+Entries are kept per endpoint for a fixed TTL, and a family of endpoints
+(everything under /images, /account...) is dropped whenever a mutating call
+touches it. Backends store the encoded JSON, so callers always get a fresh
+copy they are free to modify.
+"""
+
+import hashlib
+import json as json_module
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from .codec import get_codec
+
+# Endpoints cached by default and for how long, in seconds.
+DEFAULT_TTLS = {
+    '/sizes': 24 * 3600,
+    '/regions': 24 * 3600,
+    '/images': 3600,
+    '/account/keys': 3600,
+}
+
+# Mutations of a family that change another one as well, e.g. snapshotting
+# or destroying a droplet creates or removes images.
+RELATED_FAMILIES = {
+    'droplets': ('images',),
+}
+
+
+def resource_family(path):
+    """
+    '/account/keys/12' -> 'account'
+    """
+    return path.split('?', 1)[0].strip('/').split('/', 1)[0]
+
+
+class MemoryCache(object):
+    """
+    In-process LRU bounded by entry count and total size.
+    """
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (expires, family, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._remove(key)
+                return None
+            self._entries[key] = self._entries.pop(key)  # most recently used
+            return entry[2]
+
+    def set(self, key, value, ttl, family):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = (time.time() + ttl, family, value)
+            self.size += len(value)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, family):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[1] == family]:
+                self._remove(key)
+
+    def _remove(self, key):
+        self.size -= len(self._entries.pop(key)[2])
+
+
+class DiskCache(object):
+    """
+    One file per entry in a directory, so that short-lived processes (e.g.
+    CLI runs) share what they fetched. Least recently used files are evicted
+    past max_entries or max_bytes in total.
+    """
+    def __init__(self, directory=None, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'dopy-cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def path(self, key, family):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '%s-%s' % (family, digest))
+
+    def get(self, key):
+        family = key.split('|', 1)[0]
+        path = self.path(key, family)
+        try:
+            with open(path, 'rb') as f:
+                expires = float(f.readline())
+                value = f.read()
+        except (IOError, OSError, ValueError):
+            return None
+        if expires < time.time():
+            self._unlink(path)
+            return None
+        os.utime(path, None)  # most recently used
+        return value
+
+    def set(self, key, value, ttl, family):
+        if len(value) > self.max_bytes:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(('%f\n' % (time.time() + ttl)).encode('ascii'))
+            f.write(value)
+        os.rename(tmp, self.path(key, family))
+
+        entries = []  # (mtime, size, path), least recently used first
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        while entries and (len(entries) > self.max_entries or size > self.max_bytes):
+            _, entry_size, path = entries.pop(0)
+            size -= entry_size
+            self._unlink(path)
+
+    def invalidate(self, family):
+        prefix = family + '-'
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix):
+                self._unlink(os.path.join(self.directory, name))
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class ResponseCache(object):
+    """
+    Decides what DoManager.request caches and for how long.
+
+    ttls maps collection paths to TTLs in seconds; a collection and its
+    items (/images, /images/5) are cached, the longest match winning, and
+    nothing else, e.g. /images/5/actions. codec encodes the stored entries,
+    the fastest one installed by default.
+    """
+    def __init__(self, backend=None, ttls=None, codec=None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.codec = get_codec(codec)
+
+    def ttl(self, path):
+        path = path.split('?', 1)[0].rstrip('/') or '/'
+        matches = [prefix for prefix in self.ttls
+                   if path == prefix or (path.startswith(prefix.rstrip('/') + '/') and
+                                         '/' not in path[len(prefix.rstrip('/')) + 1:])]
+        if matches:
+            return self.ttls[max(matches, key=len)]
+
+    def key(self, scope, path, params):
+        query = json_module.dumps(params or {}, sort_keys=True)
+        return '%s|%s|%s|%s' % (resource_family(path), scope, path, query)
+
+    def get(self, scope, path, params):
+        if not self.ttl(path):
+            return None
+        value = self.backend.get(self.key(scope, path, params))
+        if value is not None:
+            return self.codec.loads(value)
+
+    def set(self, scope, path, params, json):
+        ttl = self.ttl(path)
+        if ttl:
+            value = self.codec.dumps(json)
+            if not isinstance(value, bytes):
+                value = value.encode('utf-8')
+            self.backend.set(self.key(scope, path, params), value, ttl, resource_family(path))
+
+    def invalidate(self, path):
+        family = resource_family(path)
+        for related in (family,) + RELATED_FAMILIES.get(family, ()):
+            self.backend.invalidate(related)
@@ -0,0 +1,141 @@
+#coding: utf-8
+"""
+Command line entry point.
+
+    dopy show_droplet 12345
+    dopy --batch commands.txt --workers 8
+    printf 'show_droplet 1\\nshow_droplet 2\\n' | dopy --batch -
+
+Credentials come from the environment, as for ``python -m dopy.manager``:
+DO_API_VERSION=2 with DO_API_TOKEN, or DO_CLIENT_ID and DO_API_KEY for v.1.
+
+In batch mode every line holds a method name and its arguments (shell
+quoting applies, # starts a comment). The lines run over one manager, so one
+connection pool, and each result is written as a JSON line as soon as it
+completes: {"line": 3, "method": "show_droplet", "result": {...}} or
+{"line": 3, "method": ..., "error": "..."}, and {"line": 3, "error": "..."}
+for a line that can't be parsed.
+
+The manager (and requests with it) is only imported once the arguments are
+parsed, so usage errors and --help return immediately.
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+
+
+def create_manager(options):
+    from .manager import DoManager
+    kwargs = {'pool_size': max(10, options.workers)}
+    if options.api_endpoint:
+        kwargs['api_endpoint'] = options.api_endpoint
+    if os.environ.get('DO_API_VERSION') == '2':
+        api_token = os.environ.get('DO_API_TOKEN') or os.environ['DO_API_KEY']
+        return DoManager(None, api_token, 2, **kwargs)
+    return DoManager(os.environ['DO_CLIENT_ID'], os.environ['DO_API_KEY'], 1, **kwargs)
+
+
+def parse_commands(lines):
+    """
+    Yields (line number, method, args) for every command line, or (line
+    number, None, error message) for a line that can't be parsed.
+    """
+    for number, line in enumerate(lines, 1):
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError as e:  # e.g. an unclosed quote
+            yield number, None, '%s: %s' % (type(e).__name__, e)
+            continue
+        if words:
+            yield number, words[0], words[1:]
+
+
+def to_json(value):
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def call(do, method, args):
+    if method.startswith('_') or not callable(getattr(do, method, None)):
+        raise AttributeError('Unknown method: %s' % method)
+    result = getattr(do, method)(*args)
+    if hasattr(result, '__next__') or hasattr(result, 'next'):
+        result = list(result)  # the iter_* methods
+    return result
+
+
+def run_batch(do, commands, workers, out):
+    """
+    Runs the commands, up to workers at a time, and writes a JSON line per
+    command as it completes. No more than twice workers commands are read
+    ahead, so output starts before the input ends. Returns the number of
+    failed commands.
+    """
+    def run(command):
+        number, method, args = command
+        if method is None:
+            return {'line': number, 'error': args}
+        line = {'line': number, 'method': method}
+        try:
+            line['result'] = call(do, method, args)
+        except Exception as e:
+            line['error'] = '%s: %s' % (type(e).__name__, e)
+        return line
+
+    def emit(line):
+        out.write(json.dumps(line, default=to_json, separators=(',', ':')) + '\n')
+        out.flush()
+        return 'error' in line
+
+    if workers <= 1:
+        return sum(emit(run(command)) for command in commands)
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+    failed, pending = 0, set()
+    with ThreadPoolExecutor(workers) as executor:
+        for command in commands:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                failed += sum(emit(future.result()) for future in done)
+            pending.add(executor.submit(run, command))
+        failed += sum(emit(future.result()) for future in as_completed(pending))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='dopy', description='Call DoManager methods from the command line.')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="read 'method args...' lines from FILE ('-' for stdin)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='batch commands run concurrently (default: 1)')
+    parser.add_argument('--api-endpoint', default=os.environ.get('DO_API_ENDPOINT'),
+                        help='API root url, for a proxy or a test server')
+    parser.add_argument('method', nargs='?', help='DoManager method, e.g. show_droplet')
+    parser.add_argument('args', nargs='*', help='its arguments')
+    options = parser.parse_args(argv)
+    if not options.batch and not options.method:
+        parser.error('a method or --batch is required')
+
+    with create_manager(options) as do:
+        if not options.batch:
+            import pprint
+            pprint.pprint(call(do, options.method, options.args))
+            return 0
+
+        if options.batch == '-':
+            failed = run_batch(do, parse_commands(sys.stdin), options.workers, sys.stdout)
+        else:
+            with open(options.batch) as f:
+                failed = run_batch(do, parse_commands(f), options.workers, sys.stdout)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
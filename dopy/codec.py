@@ -0,0 +1,63 @@
+#coding: utf-8
+"""
+JSON codecs for request and response bodies.
+
+orjson and ujson decode large listings several times faster than the
+standard library; the fastest one installed is used unless told otherwise.
+"""
+
+import json
+
+
+class StdlibCodec(object):
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(object):
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+class UjsonCodec(object):
+    name = 'ujson'
+
+    def __init__(self):
+        import ujson
+        self.dumps = ujson.dumps
+        self.loads = ujson.loads
+
+
+CODECS = {
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec,
+    'json': StdlibCodec,
+}
+
+
+def get_codec(codec=None):
+    """
+    Returns a codec given its name, or the fastest one available for None.
+    Objects with dumps() and loads() methods are returned as is.
+    """
+    if codec is None:
+        for name in ('orjson', 'ujson'):
+            try:
+                return CODECS[name]()
+            except ImportError:
+                pass
+        return StdlibCodec()
+    if isinstance(codec, str):
+        return CODECS[codec]()
+    return codec
@@ -0,0 +1,109 @@
+#coding: utf-8
+"""
+Moves floating IPs between droplets with as few requests as possible.
+
+The floating IP -> droplet mapping is loaded once (refresh()) and then kept
+up to date by the moves themselves, so a failover sends nothing but the
+assign: the API reassigns an IP that is already assigned elsewhere, without
+an unassign first. Completion is tracked by a waiter of its own, polling
+more often than the manager's default one.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from .manager import run_concurrently
+from .waiter import ActionWaiter
+
+# elapsed: seconds from sending the assign until its action completed (or
+# failed); accepted: until the API acknowledged it.
+Move = namedtuple('Move', 'ip droplet_id previous action accepted elapsed error')
+
+
+class FloatingIPFailover(object):
+    def __init__(self, manager, interval=0.25, max_interval=2.0):
+        self.manager = manager
+        self.waiter = ActionWaiter(manager, interval=interval,
+                                   max_interval=max_interval, backoff=1.2)
+        self.assignments = {}  # ip -> droplet id, or None
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Reloads the floating IPs of the account and returns the mapping.
+        """
+        assignments = {}
+        for floating_ip in self.manager.iter_floating_ips():
+            droplet = floating_ip['droplet']
+            assignments[floating_ip['ip']] = droplet['id'] if droplet else None
+        with self._lock:
+            self.assignments = assignments
+            self.refreshed_at = time.time()
+        return assignments
+
+    def assigned_to(self, ip):
+        return self.assignments.get(ip)
+
+    def move(self, ip, droplet_id, wait=True, timeout=None):
+        """
+        Assigns ip to droplet_id and returns a Move. With wait, it returns
+        once the action completed; the IP answers on the new droplet by then.
+        """
+        return self.move_many({ip: droplet_id}, wait, timeout)[ip]
+
+    def move_many(self, moves, wait=True, timeout=None, max_workers=None):
+        """
+        Sends every assign of moves ({ip: droplet id}) at once, and returns
+        a Move per ip. IPs already on their droplet are left alone.
+        """
+        started = time.time()
+        previous = dict((ip, self.assignments.get(ip)) for ip in moves)
+        pending = [ip for ip, droplet_id in moves.items()
+                   if previous[ip] is None or str(previous[ip]) != str(droplet_id)]
+
+        def assign(ip):
+            action = self.manager.assign_floating_ip(ip, moves[ip])
+            return action, time.time() - started
+
+        results, errors = run_concurrently(
+            assign, pending, max_workers or max(len(pending), 1))
+
+        done = {}
+        for ip in moves:
+            if ip not in pending:
+                done[ip] = Move(ip, moves[ip], previous[ip], None, 0.0, 0.0, None)
+            elif ip in errors:
+                done[ip] = Move(ip, moves[ip], previous[ip], None, None,
+                                time.time() - started, errors[ip])
+            else:
+                with self._lock:
+                    self.assignments[ip] = moves[ip]
+                action, accepted = results[ip]
+                done[ip] = Move(ip, moves[ip], previous[ip], action, accepted, None, None)
+        if not wait:
+            return done
+
+        completed = {}  # ip -> when its action was seen done
+
+        def submit(ip):
+            def callback(future):
+                completed[ip] = time.time()
+            return self.waiter.submit(done[ip].action['id'], timeout, callback)
+
+        futures = dict((ip, submit(ip)) for ip in results)
+        for ip, future in futures.items():
+            try:
+                action, error = future.result(), None
+            except Exception as e:
+                action, error = done[ip].action, e
+            elapsed = completed.get(ip, time.time()) - started
+            done[ip] = done[ip]._replace(action=action, elapsed=elapsed, error=error)
+            if error is not None:
+                # Unless moved again since, back to what it was so that a
+                # retry sends the assign again.
+                with self._lock:
+                    if self.assignments.get(ip) == moves[ip]:
+                        self.assignments[ip] = previous[ip]
+        return done
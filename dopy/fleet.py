@@ -0,0 +1,114 @@
+#coding: utf-8
+"""
+Runs the same call against several accounts at once.
+
+Every account gets its own DoManager, hence its own connection pool and
+rate limiter (the budget is per token). A call goes out to all accounts
+concurrently and the results come back as each account finishes, so a
+cross-account query takes as long as the slowest account rather than the
+sum of them all.
+"""
+
+from collections import namedtuple
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .manager import DoError, DoManager
+
+AccountResult = namedtuple('AccountResult', 'account result error')
+
+
+class FleetError(DoError):
+    """
+    Raised once the results of the other accounts were all returned;
+    errors maps the failed accounts to their exception.
+    """
+    def __init__(self, errors):
+        DoError.__init__(self, 'Failed for %s' % ', '.join(sorted(map(str, errors))))
+        self.errors = errors
+
+
+class FleetManager(object):
+    def __init__(self, accounts, max_workers=None, **manager_options):
+        """
+        accounts maps a name to a v2 API token, or to a DoManager to use as
+        is; manager_options are passed on to the DoManagers created here.
+        """
+        self.managers = {}
+        for account, token in accounts.items():
+            if not isinstance(token, DoManager):
+                token = DoManager(None, token, 2, **manager_options)
+            self.managers[account] = token
+        self.max_workers = max_workers or len(self.managers) or 1
+
+    def close(self):
+        for manager in self.managers.values():
+            manager.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stream(self, method, *args, **kwargs):
+        """
+        Calls method(*args, **kwargs) on every account and yields an
+        AccountResult per account, in the order they finish.
+        """
+        def call(manager):
+            result = getattr(manager, method)(*args, **kwargs)
+            if hasattr(result, '__next__') or hasattr(result, 'next'):
+                result = list(result)  # the iter_* methods
+            return result
+
+        with ThreadPoolExecutor(min(self.max_workers, len(self.managers) or 1)) as executor:
+            futures = dict((executor.submit(call, manager), account)
+                           for account, manager in self.managers.items())
+            for future in as_completed(futures):
+                try:
+                    yield AccountResult(futures[future], future.result(), None)
+                except Exception as e:
+                    yield AccountResult(futures[future], None, e)
+
+    def map(self, method, *args, **kwargs):
+        """
+        Returns a (results, errors) pair of dicts keyed by account.
+        """
+        results, errors = {}, {}
+        for account, result, error in self.stream(method, *args, **kwargs):
+            if error is None:
+                results[account] = result
+            else:
+                errors[account] = error
+        return results, errors
+
+    def collect(self, method, *args, **kwargs):
+        """
+        Yields (account, item) for every item listed by method, account by
+        account as they finish. Raises FleetError at the end if some failed.
+        """
+        errors = {}
+        for account, result, error in self.stream(method, *args, **kwargs):
+            if error is not None:
+                errors[account] = error
+                continue
+            for item in result:
+                yield account, item
+        if errors:
+            raise FleetError(errors)
+
+    def all_active_droplets(self, tag_name=None):
+        return list(self.collect('all_active_droplets', tag_name=tag_name))
+
+    def all_floating_ips(self):
+        return list(self.collect('all_floating_ips'))
+
+    def all_domains(self):
+        return list(self.collect('all_domains'))
+
+    def all_tags(self):
+        return list(self.collect('all_tags'))
+
+    def all_ssh_keys(self):
+        return list(self.collect('all_ssh_keys'))
@@ -0,0 +1,107 @@
+#coding: utf-8
+"""
+Hedged GETs: when a GET takes longer than the given percentile of the
+recent latencies of its endpoint family, a second, identical request is
+sent and whichever answers first is used. It trades a few percent more
+requests for a tail latency close to the percentile.
+"""
+
+import threading
+import time
+from collections import deque
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Hedger(object):
+    def __init__(self, percentile=95, min_samples=20, window=200, min_delay=0.01,
+            max_workers=None):
+        self.percentile = percentile
+        # No hedging until a family has this many latencies recorded.
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        # Threads running the copies; the DoManager sets twice its pool_size
+        # when left None.
+        self.max_workers = max_workers
+        self.requests = 0
+        self.hedged = 0  # requests for which a second copy was sent
+        self.won = 0  # ... and answered first
+        self._latencies = {}  # family -> recent latencies of first copies
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def delay(self, family):
+        """
+        How long to wait for the first copy before sending the second one,
+        None while too few latencies are known.
+        """
+        latencies = self._latencies.get(family)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+        latencies = sorted(latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100.0))
+        return max(latencies[index], self.min_delay)
+
+    def record(self, family, seconds):
+        with self._lock:
+            latencies = self._latencies.get(family)
+            if latencies is None:
+                latencies = self._latencies[family] = deque(maxlen=self.window)
+            latencies.append(seconds)
+
+    def send(self, family, send, hedge=None):
+        """
+        Returns send(), or the result of hedge() (send() by default) when
+        that comes first.
+        """
+        with self._lock:
+            self.requests += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+        delay = self.delay(family)
+
+        if delay is None:
+            started = time.time()
+            result = send()
+            self.record(family, time.time() - started)
+            return result
+
+        # Latencies and the delay count from when the first copy starts
+        # running, not from when it was queued behind other requests.
+        running = threading.Event()
+        started = []
+
+        def run():
+            started.append(time.time())
+            running.set()
+            return send()
+
+        def timed(future):
+            if not future.exception():
+                self.record(family, time.time() - started[0])
+
+        first = self._executor.submit(run)
+        first.add_done_callback(timed)
+        running.wait()
+        if wait([first], max(0, started[0] + delay - time.time())).done:
+            return first.result()
+
+        second = self._executor.submit(hedge or send)
+        with self._lock:
+            self.hedged += 1
+        pending = set([first, second])
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            succeeded = [future for future in done if future.exception() is None]
+            if succeeded or not pending:
+                # Both failed: raise the error of either.
+                winner = (succeeded or list(done))[0]
+                if winner is second:
+                    with self._lock:
+                        self.won += 1
+                return winner.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,167 @@
+#coding: utf-8
+"""
+A local, SQLite backed copy of an account's droplets.
+
+refresh(manager) replaces the stored droplets with the account's current ones
+in a single transaction; every lookup afterwards is an indexed query on the
+local database and never touches the network. With a file path the copy
+survives between processes, so a script can answer "which droplet owns this
+IP" in milliseconds, as long as refreshed_at is recent enough for it.
+"""
+
+import json as json_module
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS droplets (
+    id INTEGER PRIMARY KEY,
+    name TEXT,
+    status TEXT,
+    region TEXT,
+    size TEXT,
+    ip_address TEXT,
+    private_ip_address TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS droplet_tags (
+    droplet_id INTEGER NOT NULL REFERENCES droplets (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (tag, droplet_id)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE INDEX IF NOT EXISTS droplets_name ON droplets (name);
+CREATE INDEX IF NOT EXISTS droplets_region ON droplets (region);
+CREATE INDEX IF NOT EXISTS droplets_size ON droplets (size);
+CREATE INDEX IF NOT EXISTS droplets_ip_address ON droplets (ip_address);
+CREATE INDEX IF NOT EXISTS droplets_private_ip_address ON droplets (private_ip_address);
+CREATE INDEX IF NOT EXISTS droplet_tags_droplet ON droplet_tags (droplet_id);
+"""
+
+
+def droplet_row(droplet):
+    """
+    The indexed columns of a droplet, from either API version.
+    """
+    if hasattr(droplet, 'to_dict'):
+        droplet = droplet.to_dict()
+    region = droplet.get('region')
+    region = region.get('slug') if isinstance(region, dict) else droplet.get('region_id')
+    size = droplet.get('size_slug') or droplet.get('size_id')
+    return (droplet['id'], droplet.get('name'), droplet.get('status'),
+            None if region is None else str(region), None if size is None else str(size),
+            droplet.get('ip_address') or None, droplet.get('private_ip_address') or None,
+            json_module.dumps(droplet, separators=(',', ':')))
+
+
+class InventoryStore(object):
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def refreshed_at(self):
+        """
+        When refresh() last completed, as a timestamp, or None.
+        """
+        row = self._query("SELECT value FROM meta WHERE key = 'refreshed_at'")
+        return float(row[0][0]) if row else None
+
+    def age(self):
+        """
+        Seconds since the last refresh, None if there never was one.
+        """
+        refreshed_at = self.refreshed_at
+        return None if refreshed_at is None else time.time() - refreshed_at
+
+    def is_stale(self, max_age):
+        age = self.age()
+        return age is None or (max_age is not None and age > max_age)
+
+    def refresh(self, manager):
+        """
+        Replaces the stored droplets with the account's current ones and
+        returns how many there are.
+        """
+        rows, tags = [], []
+        for droplet in manager.iter_droplets():
+            row = droplet_row(droplet)
+            rows.append(row)
+            tags.extend((row[0], tag) for tag in droplet.get('tags') or ())
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM droplet_tags')
+            self._db.execute('DELETE FROM droplets')
+            self._db.executemany('INSERT INTO droplets VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.executemany('INSERT OR IGNORE INTO droplet_tags VALUES (?, ?)', tags)
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('refreshed_at', ?)",
+                             (repr(time.time()),))
+        return len(rows)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _droplets(self, where='', args=()):
+        rows = self._query('SELECT data FROM droplets %s ORDER BY id' % where, args)
+        return [json_module.loads(row[0]) for row in rows]
+
+    def get(self, droplet_id):
+        droplets = self._droplets('WHERE id = ?', (int(droplet_id),))
+        return droplets[0] if droplets else None
+
+    def by_name(self, name):
+        return self._droplets('WHERE name = ?', (name,))
+
+    def by_ip(self, ip):
+        """
+        The droplet with this public or private IPv4 address, or None.
+        """
+        droplets = self._droplets('WHERE ip_address = ? OR private_ip_address = ?', (ip, ip))
+        return droplets[0] if droplets else None
+
+    def find(self, tag=None, region=None, size=None, status=None, name=None):
+        """
+        The droplets matching every given criterion, e.g.
+        find(tag='web', region='ams3').
+        """
+        clauses, args = [], []
+        for column, value in (('region', region), ('size', size),
+                              ('status', status), ('name', name)):
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                args.append(str(value))
+        if tag is not None:
+            clauses.append('id IN (SELECT droplet_id FROM droplet_tags WHERE tag = ?)')
+            args.append(tag)
+        return self._droplets('WHERE ' + ' AND '.join(clauses) if clauses else '', args)
+
+    def all(self):
+        return self._droplets()
+
+    def tags(self):
+        """
+        The number of droplets per tag.
+        """
+        return dict(self._query('SELECT tag, COUNT(*) FROM droplet_tags GROUP BY tag'))
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM droplets')[0][0]
@@ -5,93 +5,404 @@ This module simply sends request to the Digital Ocean API,
 and returns their response as a dict.
 """
 
+import copy
+import hashlib
+import random
+import threading
+import time
+
 import requests
 import json as json_module
-from six import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from six import string_types, wraps
+from six.moves.urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+
+from .cache import MemoryCache, ResponseCache
+from .codec import get_codec
+from .metrics import COLLECTIONS, RequestEvent, endpoint_family, path_template
+from .models import MODELS
+from .ratelimit import RateLimiter
+from .transport import DEFAULT_POOL_SIZE, HttpxTransport, RequestsTransport
 
 API_ENDPOINT = 'https://api.digitalocean.com'
+DEFAULT_TIMEOUT = 60
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+MAX_RETRY_DELAY = 60
+VALIDATORS_TTL = 24 * 3600
+# The largest page the v2 API serves.
+MAX_PER_PAGE = 200
 
 class DoError(RuntimeError):
     pass
 
 
+class NotFound(DoError):
+    """
+    The API answered 404: the resource doesn't exist (anymore).
+    """
+
+
+def page_link(result, rel):
+    """
+    Returns the `rel` ('next', 'last'...) page url of a v2 listing, if any.
+    """
+    if isinstance(result, dict):
+        return result.get('links', {}).get('pages', {}).get(rel)
+
+
+def page_number(url):
+    try:
+        return int(parse_qs(urlparse(url).query)['page'][-1])
+    except (KeyError, ValueError):
+        return None
+
+
+def page_url(url, number):
+    return merge_query(url, {'page': number})
+
+
+def merge_query(url, params):
+    """
+    Returns url with params set in its query string, replacing the values
+    already there (e.g. those carried by the links to other pages).
+    """
+    if not params:
+        return url
+    parts = urlparse(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    for key, value in params.items():
+        query[key] = [str(value)]
+    return urlunparse(parts._replace(query=urlencode(sorted(query.items()), doseq=True)))
+
+
+def is_listing(url):
+    """
+    Whether url lists a collection, e.g. /droplets or /domains/{name}/records.
+    """
+    last = path_template(url).rsplit('/', 1)[-1]
+    return last in COLLECTIONS and last != 'account'
+
+
+# API v.1 sends every call as a GET; the last path segment tells the ones
+# changing something.
+V1_ACTIONS = set([
+    'new', 'edit', 'destroy', 'transfer', 'rename', 'resize', 'rebuild', 'restore',
+    'snapshot', 'reboot', 'shutdown', 'power_cycle', 'power_off', 'power_on',
+    'password_reset', 'enable_backups', 'disable_backups',
+])
+
+
+def is_v1_action(path):
+    """
+    Whether the API v.1 call at path changes something, e.g. /images/5/destroy.
+    """
+    return path.split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1] in V1_ACTIONS
+
+
+def iter_pages(fetch, url, max_workers=1):
+    """
+    Yields every page of a listing, in order, fetching `url` first.
+
+    When the first page advertises the last one, the remaining pages are
+    fetched concurrently on up to max_workers threads; otherwise the `next`
+    links are followed one at a time.
+    """
+    result = fetch(url)
+    yield result
+
+    nxt = page_link(result, 'next')
+    last = page_link(result, 'last')
+    if nxt and last and max_workers > 1:
+        first_number, last_number = page_number(nxt), page_number(last)
+        if first_number is not None and last_number is not None:
+            urls = [page_url(last, number)
+                    for number in range(first_number, last_number + 1)]
+            with ThreadPoolExecutor(min(max_workers, len(urls))) as executor:
+                for result in executor.map(fetch, urls):
+                    yield result
+            return
+
+    while nxt is not None:
+        result = fetch(nxt)
+        yield result
+        nxt = page_link(result, 'next')
+
+
+def run_concurrently(func, items, max_workers):
+    """
+    Calls func(item) for every item on up to max_workers threads.
+
+    Returns a (results, errors) pair of dicts keyed by item, so that one
+    failing call doesn't abort the others.
+    """
+    results, errors = {}, {}
+    items = list(items)
+    if not items:
+        return results, errors
+
+    with ThreadPoolExecutor(max(1, min(max_workers, len(items)))) as executor:
+        futures = dict((executor.submit(func, item), item) for item in items)
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+    return results, errors
+
+
+class SingleFlight(object):
+    """
+    Lets concurrent identical calls share a single execution: while a call
+    for a key is running, callers with the same key wait for its outcome
+    instead of running their own.
+    """
+    def __init__(self):
+        self._calls = {}  # key -> [done event, result, error]
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            # Copies of a snapshot taken before the leader's caller got its
+            # result, so nobody sees anyone else's changes.
+            return copy.deepcopy(call[1])
+
+        try:
+            result = func()
+            call[1] = copy.deepcopy(result)
+            return result
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+
+def merge_pages(pages, envelope=True):
+    """
+    Merges the pages of a listing into a single response, in one pass.
+
+    The lists of every page are copied into one list allocated up front from
+    meta.total, instead of growing it page after page. The other keys (links,
+    meta) are taken from the last page, or left out when envelope is False.
+    """
+    out = {}
+    lists = {}  # key -> [merged list, number of items filled in]
+
+    for page in pages:
+        if not isinstance(page, dict):
+            continue
+        for key, value in page.items():
+            if not isinstance(value, list):
+                if envelope:
+                    out[key] = value
+                continue
+
+            merged = lists.get(key)
+            if merged is None:
+                total = page.get('meta', {}).get('total')
+                if isinstance(total, int) and total > len(value):
+                    items = [None] * total
+                    items[:len(value)] = value
+                else:
+                    items = value
+                lists[key] = [items, len(value)]
+            else:
+                items, filled = merged
+                # Within the pre-sized list this replaces the placeholders in
+                # place; past its end (the listing grew) the list is extended.
+                items[filled:filled + len(value)] = value
+                merged[1] = filled + len(value)
+
+    for key, (items, filled) in lists.items():
+        del items[filled:]  # the listing may have shrunk meanwhile
+        out[key] = items
+    return out
+
+
 def paginated(func):
     @wraps(func)
-    def wrapper(self, url, headers=None, params=None, method='GET'):
-        if method != 'GET':
-            return func(self, url, headers, params, method)
-
-        nxt = url
-        out = {}
-
-        while nxt is not None:
-            result = func(self, nxt, headers, params, 'GET')
-            nxt = None
-
-            if isinstance(result, dict):
-                for key, value in result.items():
-                    if key in out and isinstance(out[key], list):
-                        out[key].extend(value)
-                    else:
-                        out[key] = value
-
-                if 'links' in result \
-                        and 'pages' in result['links'] \
-                        and 'next' in result['links']['pages']:
-                    nxt = result['links']['pages']['next']
-
-        return out
+    def wrapper(self, url, headers=None, params=None, method='GET', paginate=True, raw=False):
+        if method != 'GET' or not paginate or raw:
+            return func(self, url, headers, params, method, raw=raw)
+
+        # The params go in the url of every page, rather than being appended
+        # to the query of the page links, which already carries them.
+        params = self.page_params(url, params)
+
+        def fetch(page):
+            return func(self, merge_query(page, params), headers, None, 'GET')
+
+        return merge_pages(iter_pages(fetch, url, self.max_workers), self.keep_envelope)
     return wrapper
 
 
 class DoManager(object):
-    def __init__(self, client_id, api_key, api_version=1):
-        self.api_endpoint = API_ENDPOINT
+    def __init__(self, client_id, api_key, api_version=1, session=None,
+            pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+            api_endpoint=API_ENDPOINT, max_workers=DEFAULT_MAX_WORKERS,
+            rate_limiter=None, max_retries=DEFAULT_MAX_RETRIES, retry_backoff=1.0,
+            cache=None, validators=None, models=False, json_codec=None,
+            keep_envelope=True, single_flight=True, per_page=MAX_PER_PAGE,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT, circuit_breakers=None, hedge=False,
+            transport=None):
+        self.api_endpoint = api_endpoint
         self.client_id = client_id
         self.api_key = api_key
         self.api_version = int(api_version)
+        # Seconds to wait for a response once connected (timeout) and for
+        # the connection itself (connect_timeout).
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        # Upper bound on concurrent requests issued on behalf of one call,
+        # e.g. the pages of a listing.
+        self.max_workers = max_workers
+        # Whether merged listings keep the links and meta of their last page.
+        self.keep_envelope = keep_envelope
+        # Page size asked for by listings that don't set one; the largest
+        # by default, to take as few round-trips as possible. None leaves
+        # it to the API (20).
+        self.per_page = per_page
+        self._waiter = None
+        # Return dopy.models objects instead of dicts.
+        self.models = models
+        self.observers = []
+        # Identical GETs in flight at the same time share one request.
+        self.single_flight = SingleFlight() if single_flight else None
+        # dopy.codec name ('orjson', 'ujson', 'json') or object; the fastest
+        # installed one by default.
+        self.codec = get_codec(json_codec)
+
+        # Paces requests across threads; pass False to disable it, or a
+        # RateLimiter shared by the managers using the same token.
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter or None
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        # Fail fast on endpoint families that keep failing; pass False to
+        # disable them, or a dopy.breaker.CircuitBreakers to tune them.
+        if circuit_breakers is None:
+            from .breaker import CircuitBreakers
+            circuit_breakers = CircuitBreakers()
+        self.circuit_breakers = circuit_breakers or None
+        # Optional dopy.hedge.Hedger duplicating slow GETs; True uses one
+        # hedging past the 95th percentile. Both copies of a request need a
+        # connection, so unless told otherwise it runs twice pool_size.
+        if hedge is True:
+            from .hedge import Hedger
+            hedge = Hedger()
+        self.hedger = hedge or None
+        if self.hedger is not None and self.hedger.max_workers is None:
+            self.hedger.max_workers = 2 * pool_size
+
+        # Optional dopy.cache.ResponseCache for the catalogue endpoints
+        # (sizes, regions, images, ssh keys); True uses an in-memory one.
+        if cache is True:
+            cache = ResponseCache(codec=self.codec)
+        self.cache = cache or None
+        # Keeps entries of different accounts apart in a shared cache.
+        self.cache_scope = hashlib.sha1(
+            ('%s %s %s' % (self.api_endpoint, client_id, api_key)).encode('utf-8')).hexdigest()
+
+        # ETag/Last-Modified values and bodies of the GETs, to send
+        # conditional requests and serve 304s from; False turns it off.
+        if validators is None:
+            validators = MemoryCache(max_entries=512, max_bytes=8 * 1024 * 1024)
+        self.validators = validators or None
 
         if self.api_version == 2:
             self.api_endpoint += '/v2'
         if self.api_version == 1:
             self.api_endpoint += '/v1'
 
-    def all_active_droplets(self):
-        json = self.request('/droplets/')
+        # How requests are sent: a dopy.transport object, 'http2' for an
+        # HttpxTransport, or requests by default. A caller-supplied session
+        # or transport (e.g. one talking to a local fake server) is used as
+        # is and left open on close().
+        self._owns_transport = transport is None or transport == 'http2'
+        if transport is None:
+            transport = RequestsTransport(session, pool_size)
+        elif transport == 'http2':
+            transport = HttpxTransport(pool_size=pool_size)
+        self.transport = transport
+        self.session = getattr(transport, 'session', None)
+
+    create_session = staticmethod(RequestsTransport.create_session)
+
+    def close(self):
+        """
+        Releases the pooled connections held by the manager.
+        """
+        if self._owns_transport:
+            self.transport.close()
+        if self.hedger is not None:
+            self.hedger.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def all_active_droplets(self, tag_name=None, per_page=None):
+        """
+        With tag_name, only the droplets with that tag are listed, filtered
+        by the API rather than after fetching them all.
+        """
+        json = self.request('/droplets/', self.list_params(None, tag_name, per_page))
         if self.api_version == 2:
             for index in range(len(json['droplets'])):
                 self.populate_droplet_ips(json['droplets'][index])
-        return json['droplets']
+        return self.model_list('droplet', json['droplets'])
+
+    def iter_droplets(self, tag_name=None, per_page=None):
+        params = self.list_params(None, tag_name, per_page)
+        for droplet in self.iter_collection('/droplets/', 'droplets', params):
+            if self.api_version == 2:
+                self.populate_droplet_ips(droplet)
+            yield self.model('droplet', droplet)
+
+    def inventory(self, path=':memory:', max_age=None):
+        """
+        An InventoryStore of the account's droplets, kept at path (a SQLite
+        file). It is refreshed first if it never was, or is older than
+        max_age seconds; call its refresh(do) to update it explicitly.
+        """
+        from .inventory import InventoryStore
+        store = InventoryStore(path)
+        if store.is_stale(max_age):
+            store.refresh(self)
+        return store
 
     def new_droplet(self, name, size_id, image_id, region_id,
             ssh_key_ids=None, virtio=True, private_networking=False,
-            backups_enabled=False, user_data=None, ipv6=False):
-
+            backups_enabled=False, user_data=None, ipv6=False, wait=False, timeout=None):
+        """
+        With wait (v2 only), returns the droplet once it is active and has
+        its IP addresses, rather than as it was right after being created.
+        """
         if self.api_version == 2:
-            params = {
-                'name': str(name),
-                'size': str(size_id),
-                'image': str(image_id),
-                'region': str(region_id),
-                'virtio': str(virtio).lower(),
-                'ipv6': str(ipv6).lower(),
-                'private_networking': str(private_networking).lower(),
-                'backups': str(backups_enabled).lower(),
-            }
-            if ssh_key_ids:
-                # Need to be an array in v2
-                if isinstance(ssh_key_ids, basestring):
-                    ssh_key_ids = [ssh_key_ids]
-
-                if type(ssh_key_ids) == list:
-                    for index in range(len(ssh_key_ids)):
-                        ssh_key_ids[index] = str(ssh_key_ids[index])
-
-                params['ssh_keys'] = ssh_key_ids
-
-            if user_data:
-                params['user_data'] = user_data
-
+            if wait:
+                return next(self.provision_droplets(
+                    [name], size_id, image_id, region_id, ssh_key_ids, virtio,
+                    private_networking, backups_enabled, user_data, ipv6, timeout=timeout))
+            params = self.v2_droplet_params(size_id, image_id, region_id,
+                ssh_key_ids, virtio, private_networking, backups_enabled, user_data, ipv6)
+            params['name'] = str(name)
             json = self.request('/droplets', params=params, method='POST')
             created_id = json['droplet']['id']
             json = self.show_droplet(created_id)
@@ -113,13 +424,52 @@ class DoManager(object):
                 params['ssh_key_ids'] = ssh_key_ids
 
             json = self.request('/droplets/new', params=params)
-            return json['droplet']
+            return self.model('droplet', json['droplet'])
+
+    def v2_droplet_params(self, size_id, image_id, region_id, ssh_key_ids=None,
+            virtio=True, private_networking=False, backups_enabled=False,
+            user_data=None, ipv6=False):
+        params = {
+            'size': str(size_id),
+            'image': str(image_id),
+            'region': str(region_id),
+            'virtio': str(virtio).lower(),
+            'ipv6': str(ipv6).lower(),
+            'private_networking': str(private_networking).lower(),
+            'backups': str(backups_enabled).lower(),
+        }
+        if ssh_key_ids:
+            # Need to be an array in v2
+            if isinstance(ssh_key_ids, string_types):
+                ssh_key_ids = [ssh_key_ids]
+            params['ssh_keys'] = [str(key_id) for key_id in ssh_key_ids]
+
+        if user_data:
+            params['user_data'] = user_data
+        return params
+
+    def provision_droplets(self, names, size_id, image_id, region_id,
+            ssh_key_ids=None, virtio=True, private_networking=False,
+            backups_enabled=False, user_data=None, ipv6=False, timeout=None,
+            batch_size=None, max_workers=None):
+        """
+        Creates a droplet per name, up to ten per request and the requests in
+        parallel, and yields each one as soon as it is active and has its IP
+        addresses. Raises ProvisionError at the end if some failed.
+        """
+        if self.api_version != 2:
+            raise DoError(self.v2_api_required_str)
+        from .provision import MAX_BATCH, provision_droplets
+        params = self.v2_droplet_params(size_id, image_id, region_id,
+            ssh_key_ids, virtio, private_networking, backups_enabled, user_data, ipv6)
+        return provision_droplets(self, names, params, batch_size or MAX_BATCH,
+                                  timeout, max_workers)
 
     def show_droplet(self, droplet_id):
         json = self.request('/droplets/%s' % droplet_id)
         if self.api_version == 2:
             self.populate_droplet_ips(json['droplet'])
-        return json['droplet']
+        return self.model('droplet', json['droplet'])
 
     def droplet_v2_action(self, droplet_id, droplet_type, params=None):
         if params is None:
@@ -128,6 +478,50 @@ class DoManager(object):
         json = self.request('/droplets/%s/actions' % droplet_id, params=params, method='POST')
         return json
 
+    def tag_droplet_action(self, tag_name, droplet_type, params=None):
+        """
+        Runs an action on every droplet carrying tag_name with one request.
+        """
+        if self.api_version != 2:
+            raise DoError(self.v2_api_required_str)
+        if params is None:
+            params = {}
+        params['type'] = droplet_type
+        json = self.request(merge_query('/droplets/actions', {'tag_name': tag_name}),
+                            params=params, method='POST')
+        return self.model_list('action', json['actions'])
+
+    def batch_droplet_action(self, droplet_ids, droplet_type, params=None,
+            tag_name=None, max_workers=None):
+        """
+        Runs the same action on many droplets, max_workers requests at a time.
+
+        Returns a (results, errors) pair of dicts keyed by droplet id; a
+        droplet failing doesn't fail the batch. When tag_name is given and
+        the targets are exactly the droplets carrying it (one listing to
+        check), the tag-scoped endpoint is used instead and the whole batch
+        costs a single request; otherwise each droplet gets its own.
+        """
+        if self.api_version != 2:
+            raise DoError(self.v2_api_required_str)
+
+        if tag_name is not None:
+            targets = dict((str(droplet_id), droplet_id) for droplet_id in droplet_ids)
+            tagged = set(str(droplet['id']) for droplet in self.iter_collection(
+                '/droplets/', 'droplets', self.list_params(None, tag_name, MAX_PER_PAGE)))
+            if tagged == set(targets):
+                actions = self.tag_droplet_action(tag_name, droplet_type, dict(params or {}))
+                results = dict((targets.get(str(action['resource_id']), action['resource_id']),
+                                {'action': action}) for action in actions)
+                return results, {}
+
+        def act(droplet_id):
+            json = self.droplet_v2_action(droplet_id, droplet_type, dict(params or {}))
+            json.pop('status', None)
+            return json
+
+        return run_concurrently(act, droplet_ids, max_workers or self.max_workers)
+
     def reboot_droplet(self, droplet_id):
         if self.api_version == 2:
             json = self.droplet_v2_action(droplet_id, 'reboot')
@@ -259,24 +653,36 @@ class DoManager(object):
                 droplet[u'private_ip_address'] = network['ip_address']
 
 #regions==========================================
-    def all_regions(self):
-        json = self.request('/regions/')
+    def all_regions(self, per_page=None):
+        json = self.request('/regions/', self.list_params(per_page=per_page))
         return json['regions']
 
+    def iter_regions(self, per_page=None):
+        return self.iter_collection('/regions/', 'regions', self.list_params(per_page=per_page))
+
 #images==========================================
-    def all_images(self, filter='global'):
-        params = {'filter': filter}
+    def all_images(self, filter='global', per_page=None):
+        params = self.list_params({'filter': filter}, per_page=per_page)
         json = self.request('/images/', params)
-        return json['images']
+        return self.model_list('image', json['images'])
+
+    def iter_images(self, filter='global', per_page=None):
+        params = self.list_params({'filter': filter}, per_page=per_page)
+        return self.model_iter('image', self.iter_collection('/images/', 'images', params))
 
     def private_images(self):
         if self.api_version == 2:
             json = self.request('/images?private=true')
-            return json['images']
+            return self.model_list('image', json['images'])
         else:
             params = {'filter': 'my_images'}
             json = self.request('/images/', params)
-            return json['images']
+            return self.model_list('image', json['images'])
+
+    def iter_private_images(self):
+        if self.api_version == 2:
+            return self.model_iter('image', self.iter_collection('/images?private=true', 'images'))
+        return self.iter_images('my_images')
 
     def image_v2_action(self, image_id, image_type, params=None):
         if params is None:
@@ -288,7 +694,7 @@ class DoManager(object):
     def show_image(self, image_id):
         params = {'image_id': image_id}
         json = self.request('/images/%s' % image_id)
-        return json['image']
+        return self.model('image', json['image'])
 
     def destroy_image(self, image_id):
         if self.api_version == 2:
@@ -315,6 +721,11 @@ class DoManager(object):
             json = self.request('/ssh_keys/')
         return json['ssh_keys']
 
+    def iter_ssh_keys(self):
+        if self.api_version == 2:
+            return self.iter_collection('/account/keys', 'ssh_keys')
+        return self.iter_collection('/ssh_keys/', 'ssh_keys')
+
     def new_ssh_key(self, name, pub_key):
         if self.api_version == 2:
             params = {'name': name, 'public_key': pub_key}
@@ -348,15 +759,21 @@ class DoManager(object):
         return True
 
 #sizes============================================
-    def sizes(self):
-        json = self.request('/sizes/')
+    def sizes(self, per_page=None):
+        json = self.request('/sizes/', self.list_params(per_page=per_page))
         return json['sizes']
 
+    def iter_sizes(self, per_page=None):
+        return self.iter_collection('/sizes/', 'sizes', self.list_params(per_page=per_page))
+
 #domains==========================================
-    def all_domains(self):
-        json = self.request('/domains/')
+    def all_domains(self, per_page=None):
+        json = self.request('/domains/', self.list_params(per_page=per_page))
         return json['domains']
 
+    def iter_domains(self, per_page=None):
+        return self.iter_collection('/domains/', 'domains', self.list_params(per_page=per_page))
+
     def new_domain(self, name, ip):
         params = {
                 'name': name,
@@ -379,11 +796,17 @@ class DoManager(object):
             self.request('/domains/%s/destroy/' % domain_id)
         return True
 
-    def all_domain_records(self, domain_id):
-        json = self.request('/domains/%s/records/' % domain_id)
+    def all_domain_records(self, domain_id, per_page=None):
+        json = self.request('/domains/%s/records/' % domain_id,
+                            self.list_params(per_page=per_page))
         if self.api_version == 2:
-            return json['domain_records']
-        return json['records']
+            return self.model_list('domain_record', json['domain_records'])
+        return self.model_list('domain_record', json['records'])
+
+    def iter_domain_records(self, domain_id, per_page=None):
+        key = 'domain_records' if self.api_version == 2 else 'records'
+        return self.model_iter('domain_record', self.iter_collection(
+            '/domains/%s/records/' % domain_id, key, self.list_params(per_page=per_page)))
 
     def new_domain_record(self, domain_id, record_type, data, name=None, priority=None, port=None, weight=None):
         params = {'data': data}
@@ -400,22 +823,22 @@ class DoManager(object):
 
         if self.api_version == 2:
             json = self.request('/domains/%s/records/' % domain_id, params, method='POST')
-            return json['domain_record']
+            return self.model('domain_record', json['domain_record'])
         else:
             json = self.request('/domains/%s/records/new/' % domain_id, params)
-            return json['record']
+            return self.model('domain_record', json['record'])
 
     def show_domain_record(self, domain_id, record_id):
         json = self.request('/domains/%s/records/%s' % (domain_id, record_id))
         if self.api_version == 2:
-            return json['domain_record']
-        return json['record']
+            return self.model('domain_record', json['domain_record'])
+        return self.model('domain_record', json['record'])
 
     def edit_domain_record(self, domain_id, record_id, record_type, data, name=None, priority=None, port=None, weight=None):
         if self.api_version == 2:
             params = {'name': name} # API v.2 allows only record name change
             json = self.request('/domains/%s/records/%s' % (domain_id, record_id), params, method='PUT')
-            return json['domain_record']
+            return self.model('domain_record', json['domain_record'])
 
         params = {
             'record_type': record_type,
@@ -427,7 +850,7 @@ class DoManager(object):
         if port: params['port'] = port
         if weight: params['weight'] = weight
         json = self.request('/domains/%s/records/%s/edit/' % (domain_id, record_id), params)
-        return json['record']
+        return self.model('domain_record', json['record'])
 
     def destroy_domain_record(self, domain_id, record_id):
         if self.api_version == 2:
@@ -436,39 +859,87 @@ class DoManager(object):
             self.request('/domains/%s/records/%s/destroy/' % (domain_id, record_id))
         return True
 
+    def reconcile_domain_records(self, domain_id, desired, dry_run=False, prune=True,
+            max_workers=None):
+        """
+        Creates, updates and deletes records so that the domain holds exactly
+        the desired ones (dicts with type, name, data and optionally priority,
+        port, weight, ttl). Returns (plan, results, errors); print the plan
+        of a dry_run to see what would change.
+        """
+        if self.api_version != 2:
+            raise DoError(self.v2_api_required_str)
+        from .reconcile import reconcile_records
+        return reconcile_records(self, domain_id, desired, dry_run, prune, max_workers)
+
 #events(actions in v2 API)========================
-    def show_all_actions(self):
+    def show_all_actions(self, per_page=None):
         if self.api_version == 2:
-            json = self.request('/actions')
-            return json['actions']
+            json = self.request('/actions', self.list_params(per_page=per_page))
+            return self.model_list('action', json['actions'])
         return False # API v.1 haven't this functionality
 
+    def iter_actions(self, per_page=None):
+        if self.api_version == 2:
+            return self.model_iter('action', self.iter_collection(
+                '/actions', 'actions', self.list_params(per_page=per_page)))
+        raise DoError(self.v2_api_required_str)
+
     def show_action(self, action_id):
         if self.api_version == 2:
-            json = self.request('/actions/%s' % event_id)
-            return json['action']
-        return show_event(self, action_id)
+            json = self.request('/actions/%s' % action_id)
+            return self.model('action', json['action'])
+        return self.show_event(action_id)
 
     def show_event(self, event_id):
         if self.api_version == 2:
-            return show_action(self, event_id)
+            return self.show_action(event_id)
         json = self.request('/events/%s' % event_id)
         return json['event']
 
+    @property
+    def waiter(self):
+        """
+        The ActionWaiter shared by every wait on this manager.
+        """
+        if self._waiter is None:
+            from .waiter import ActionWaiter
+            self._waiter = ActionWaiter(self)
+        return self._waiter
+
+    def wait_for_actions(self, actions, timeout=None):
+        """
+        Blocks until the given actions (or their ids) completed, and returns
+        them. Raises DoError if one errored and ActionTimeout after timeout.
+        """
+        if self.api_version != 2:
+            raise DoError(self.v2_api_required_str)
+        return self.waiter.wait(actions, timeout)
+
 #floating_ips=====================================
     v2_api_required_str = ('This feature requires the V2 API. ' \
         'In order to continue, update DO_API_VERSION to 2.')
 
-    def all_floating_ips(self):
+    def all_floating_ips(self, per_page=None):
         """
         Lists all of the Floating IPs available on the account.
         """
         if self.api_version == 2:
-            json = self.request('/floating_ips')
-            return json['floating_ips']
+            json = self.request('/floating_ips', self.list_params(per_page=per_page))
+            return self.model_list('floating_ip', json['floating_ips'])
         else:
             raise DoError(v2_api_required_str)
 
+    def iter_floating_ips(self, per_page=None):
+        """
+        Yields the Floating IPs of the account, page by page.
+        """
+        if self.api_version == 2:
+            return self.model_iter('floating_ip', self.iter_collection(
+                '/floating_ips', 'floating_ips', self.list_params(per_page=per_page)))
+        else:
+            raise DoError(self.v2_api_required_str)
+
     def new_floating_ip(self, **kwargs):
         """
         Creates a Floating IP and assigns it to a Droplet or reserves it to a region.
@@ -490,7 +961,7 @@ class DoManager(object):
                     params = {'region': region}
 
                 json = self.request('/floating_ips', params=params, method='POST')
-                return json['floating_ip']
+                return self.model('floating_ip', json['floating_ip'])
         else:
             raise DoError(v2_api_required_str)
 
@@ -511,7 +982,7 @@ class DoManager(object):
             params = {'type': 'assign','droplet_id': droplet_id}
 
             json = self.request('/floating_ips/' + ip_addr + '/actions', params=params, method='POST')
-            return json['action']
+            return self.model('action', json['action'])
         else:
             raise DoError(v2_api_required_str)
 
@@ -524,7 +995,7 @@ class DoManager(object):
             params = {'type': 'unassign'}
 
             json = self.request('/floating_ips/' + ip_addr + '/actions', params=params, method='POST')
-            return json['action']
+            return self.model('action', json['action'])
         else:
             raise DoError(v2_api_required_str)
 
@@ -534,7 +1005,7 @@ class DoManager(object):
         """
         if self.api_version == 2:
             json = self.request('/floating_ips/' + ip_addr + '/actions')
-            return json['actions']
+            return self.model_list('action', json['actions'])
         else:
             raise DoError(v2_api_required_str)
 
@@ -544,7 +1015,7 @@ class DoManager(object):
         """
         if self.api_version == 2:
             json = self.request('/floating_ips/' + ip_addr + '/actions/' + action_id)
-            return json['action']
+            return self.model('action', json['action'])
         else:
             raise DoError(v2_api_required_str)
 
@@ -566,13 +1037,19 @@ class DoManager(object):
         else:
             raise DoError(self.v2_api_required_str)
 
-    def all_tags(self):
+    def all_tags(self, per_page=None):
         if self.api_version == 2:
-            json = self.request('/tags', method='GET')
+            json = self.request('/tags', self.list_params(per_page=per_page), method='GET')
             return json['tags']
         else:
             raise DoError(self.v2_api_required_str)
 
+    def iter_tags(self, per_page=None):
+        if self.api_version == 2:
+            return self.iter_collection('/tags', 'tags', self.list_params(per_page=per_page))
+        else:
+            raise DoError(self.v2_api_required_str)
+
     def edit_tag(self, current_name, new_name):
         if self.api_version == 2:
             params = {
@@ -626,28 +1103,127 @@ class DoManager(object):
             raise DoError(self.v2_api_required_str)
 
 #low_level========================================
-    def request(self, path, params={}, method='GET'):
+    def request(self, path, params={}, method='GET', raw=False):
+        """
+        Sends a request and returns the decoded response. With raw=True the
+        response body is returned as bytes instead, undecoded and for the
+        requested page only (API v.2).
+        """
         if not path.startswith('/'):
             path = '/'+path
         url = self.api_endpoint+path
 
+        if raw:
+            if self.api_version != 2:
+                raise DoError(self.v2_api_required_str)
+            return self.request_v2(url, params=params, headers=self.v2_headers(),
+                                   method=method, raw=True)
+
+        reads = method == 'GET' and (self.api_version == 2 or not is_v1_action(path))
+        if self.cache is not None and reads:
+            json = self.cache.get(self.cache_scope, path, params)
+            if json is not None:
+                return json
+
         if self.api_version == 2:
-            headers = {'Authorization': "Bearer %s" % self.api_key}
-            resp = self.request_v2(url, params=params, headers=headers, method=method)
+            headers = self.v2_headers()
+            if method == 'GET' and self.single_flight is not None:
+                key = (path, json_module.dumps(params or {}, sort_keys=True))
+                resp = self.single_flight.do(key, lambda: self.request_v2(
+                    url, params=params, headers=headers, method=method))
+            else:
+                resp = self.request_v2(url, params=params, headers=headers, method=method)
         else:
-            params['client_id'] = self.client_id
-            params['api_key'] = self.api_key
-            resp = self.request_v1(url, params, method=method)
+            v1_params = dict(params, client_id=self.client_id, api_key=self.api_key)
+            resp = self.request_v1(url, v1_params, method=method)
+
+        if self.cache is not None:
+            if reads:
+                self.cache.set(self.cache_scope, path, params, resp)
+            else:
+                self.cache.invalidate(path)
 
         return resp
 
+    def iter_request(self, path, params=None):
+        """
+        Yields the pages of a listing one at a time, as they arrive.
+        API v.1 has no pagination, so its whole response is the only page.
+        """
+        if self.api_version != 2:
+            yield self.request(path, dict(params or {}))
+            return
+
+        if not path.startswith('/'):
+            path = '/'+path
+        url = self.api_endpoint+path
+        headers = self.v2_headers()
+        params = self.page_params(url, params)
+
+        def fetch(page):
+            return self.request_v2(merge_query(page, params), headers=headers, paginate=False)
+
+        for page in iter_pages(fetch, url):
+            yield page
+
+    def iter_collection(self, path, key, params=None):
+        """
+        Yields the items listed under `key`, page by page.
+        """
+        for page in self.iter_request(path, params):
+            for item in page.get(key, []):
+                yield item
+
+    def page_params(self, url, params):
+        """
+        The params of a v.2 GET, with per_page defaulting to self.per_page
+        when url lists a collection.
+        """
+        params = dict(params or {})
+        if self.per_page and 'per_page' not in params and is_listing(url):
+            params['per_page'] = self.per_page
+        return params
+
+    def list_params(self, params=None, tag_name=None, per_page=None):
+        """
+        The query of a listing: params plus the tag_name filter (droplets
+        only) and page size, when given. API v.1 takes neither.
+        """
+        params = dict(params or {})
+        if tag_name is not None:
+            if self.api_version != 2:
+                raise DoError(self.v2_api_required_str)
+            params['tag_name'] = tag_name
+        if per_page is not None and self.api_version == 2:
+            params['per_page'] = min(int(per_page), MAX_PER_PAGE)
+        return params
+
+    def model(self, kind, data):
+        if self.models:
+            return MODELS[kind](data)
+        return data
+
+    def model_list(self, kind, items):
+        if self.models:
+            return [MODELS[kind](data) for data in items]
+        return items
+
+    def model_iter(self, kind, items):
+        if self.models:
+            return (MODELS[kind](data) for data in items)
+        return items
+
+    def v2_headers(self):
+        return {'Authorization': "Bearer %s" % self.api_key}
+
     def request_v1(self, url, params={}, method='GET'):
         try:
-            resp = requests.get(url, params=params, timeout=60)
-            json = resp.json()
+            resp = self.transport.request('GET', url, params=params,
+                                          timeout=(self.connect_timeout, self.timeout))
+            json = self.codec.loads(resp.content)
         except ValueError:  # requests.models.json.JSONDecodeError
             raise ValueError("The API server doesn't respond with a valid json")
-        except requests.RequestException as e:  # errors from requests
+        except self.transport.errors as e:  # connection errors and timeouts
             raise RuntimeError(e)
 
         if resp.status_code != requests.codes.ok:
@@ -667,59 +1243,197 @@ class DoManager(object):
         if response.status_code == 204:
             return {'status': response.status_code}
         else:
-            return response.json()
+            return self.codec.loads(response.content)
 
     @paginated
-    def request_v2(self, url, headers={}, params={}, method='GET'):
-        headers['Content-Type'] = 'application/json'
+    def request_v2(self, url, headers={}, params={}, method='GET', raw=False):
+        # Pages may be fetched concurrently with the same headers.
+        headers = dict(headers, **{'Content-Type': 'application/json'})
+
+        if method not in ('POST', 'DELETE', 'PUT', 'GET'):
+            raise DoError('Unsupported method %s' % method)
+
+        stored = None
+        if method == 'GET' and self.validators is not None:
+            validators_key = 'etag|%s|%s|%s' % (self.cache_scope, url,
+                json_module.dumps(params or {}, sort_keys=True))
+            stored = self.validators.get(validators_key)
+            if stored is not None:
+                etag, last_modified, stored = stored.split(b'\n', 2)
+                # Header values as decoded by the HTTP clients.
+                if etag:
+                    headers['If-None-Match'] = etag.decode('latin-1')
+                if last_modified:
+                    headers['If-Modified-Since'] = last_modified.decode('latin-1')
+
+        attempt = 0
+        refetched = False
+        while True:
+            breaker = None
+            if self.circuit_breakers is not None:
+                breaker = self.circuit_breakers.check(url)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            sent = time.time()
+            try:
+                if method == 'GET' and self.hedger is not None:
+                    resp = self.send_hedged(url, headers, params)
+                else:
+                    resp = self.send_v2(url, headers, params, method)
+            except self.transport.errors as e:  # connection errors and timeouts
+                if breaker is not None:
+                    breaker.failure()
+                if self.observers:
+                    self.notify(RequestEvent(method, url, None, page=page_number(url) or 1,
+                                             retries=attempt, error=e))
+                raise RuntimeError(e)
+            received = time.time()
+            if breaker is not None:
+                if resp.status_code >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+            if self.rate_limiter is not None:
+                self.rate_limiter.update(resp.headers)
+
+            if resp.status_code == 304 and stored is None and not refetched:
+                # Nothing kept to serve it from (e.g. a 304 from a proxy):
+                # ask again, unconditionally.
+                refetched = True
+                headers.pop('If-None-Match', None)
+                headers.pop('If-Modified-Since', None)
+                headers['Cache-Control'] = 'no-cache'
+                continue
+
+            if attempt >= self.max_retries or not self.should_retry(resp, method):
+                break
+            self.wait_before_retry(resp, attempt)
+            attempt += 1
+
+        status_code, content = resp.status_code, resp.content
+        if status_code == 304 and stored is not None:
+            # Unchanged since last time: serve the body we kept.
+            status_code, content = requests.codes.ok, stored
+        elif method == 'GET' and self.validators is not None and status_code == 200:
+            etag = resp.headers.get('ETag', '')
+            last_modified = resp.headers.get('Last-Modified', '')
+            try:
+                validators = [etag.encode('latin-1'), last_modified.encode('latin-1')]
+            except UnicodeEncodeError:
+                validators = None  # not sendable back as is: don't keep the body
+            if validators and any(validators):
+                self.validators.set(validators_key, b'\n'.join(validators + [content]),
+                                    VALIDATORS_TTL, 'etag')
+
+        if raw and 200 <= status_code < 300:
+            if self.observers:
+                self.observe(method, url, resp, content, sent, received, received, attempt)
+            return content
 
         try:
-            if method == 'POST':
-                resp = requests.post(url, data=json_module.dumps(params), headers=headers, timeout=60)
+            if method in ('POST', 'DELETE'):
                 json = self.process_response(resp)
-            elif method == 'DELETE':
-                resp = requests.delete(url, data=json_module.dumps(params), headers=headers, timeout=60)
-                json = self.process_response(resp)
-            elif method == 'PUT':
-                resp = requests.put(url, headers=headers, params=params, timeout=60)
-                json = resp.json()
-            elif method == 'GET':
-                resp = requests.get(url, headers=headers, params=params, timeout=60)
-                json = resp.json()
             else:
-                raise DoError('Unsupported method %s' % method)
-
-        except ValueError:  # requests.models.json.JSONDecodeError
+                json = self.codec.loads(content)
+        except ValueError as e:  # requests.models.json.JSONDecodeError
+            if self.observers:
+                self.observe(method, url, resp, content, sent, received, time.time(), attempt, e)
             raise ValueError("The API server doesn't respond with a valid json")
-        except requests.RequestException as e:  # errors from requests
-            raise RuntimeError(e)
+        if self.observers:
+            self.observe(method, url, resp, content, sent, received, time.time(), attempt)
 
-        if resp.status_code != requests.codes.ok:
+        if status_code != requests.codes.ok:
+            error = NotFound if status_code == 404 else DoError
             if json:
                 if 'error_message' in json:
-                    raise DoError(json['error_message'])
+                    raise error(json['error_message'])
                 elif 'message' in json:
-                    raise DoError(json['message'])
+                    raise error(json['message'])
             # The JSON reponse is bad, so raise an exception with the HTTP status
             resp.raise_for_status()
 
         if json.get('id') == 'not_found':
-            raise DoError(json['message'])
+            raise NotFound(json['message'])
 
         return json
 
+    def add_observer(self, observer):
+        """
+        Registers observer(event) to be called with a dopy.metrics.RequestEvent
+        after every v2 request, e.g. a dopy.metrics.EndpointStats.
+        """
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def observe(self, method, url, resp, content, sent, received, decoded, retries, error=None):
+        # elapsed: until the headers arrived with requests, the whole
+        # response with httpx (see RequestEvent).
+        ttfb = min(resp.elapsed.total_seconds(), received - sent)
+        self.notify(RequestEvent(method, url, resp.status_code,
+            ttfb=ttfb, body=received - sent - ttfb,
+            decode=decoded - received, bytes=len(content),
+            page=page_number(url) or 1, retries=retries, error=error))
+
+    def notify(self, event):
+        for observer in self.observers:
+            try:
+                observer(event)
+            except Exception:
+                pass  # a broken observer must not break the requests
+
+    def send_v2(self, url, headers, params, method):
+        timeout = (self.connect_timeout, self.timeout)
+        if method in ('POST', 'DELETE', 'PUT'):
+            return self.transport.request(method, url, headers, data=self.codec.dumps(params),
+                                          timeout=timeout)
+        return self.transport.request(method, url, headers, params=params, timeout=timeout)
+
+    def send_hedged(self, url, headers, params):
+        """
+        send_v2 for a GET, hedged by self.hedger.
+        """
+        def send():
+            return self.send_v2(url, headers, params, 'GET')
+
+        def hedge():
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            return send()
+
+        return self.hedger.send(endpoint_family(url), send, hedge)
+
+    def should_retry(self, resp, method):
+        """
+        429s are always retried; server errors only for idempotent methods,
+        since a failed POST may still have been applied.
+        """
+        if resp.status_code == 429:
+            return True
+        return resp.status_code >= 500 and method != 'POST'
+
+    def wait_before_retry(self, resp, attempt):
+        retry_after = resp.headers.get('Retry-After')
+        if retry_after is None and resp.status_code == 429:
+            reset = resp.headers.get('RateLimit-Reset')
+            if reset is not None and reset.isdigit():
+                retry_after = int(reset) - time.time()
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.retry_backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        delay = min(max(delay, 0), MAX_RETRY_DELAY)
+
+        if resp.status_code == 429 and self.rate_limiter is not None:
+            # Hold back the other threads too; acquire() does the waiting.
+            self.rate_limiter.block(delay)
+        else:
+            time.sleep(delay)
+
 
 if __name__ == '__main__':
-    import os
-    if os.environ.get('DO_API_VERSION') == '2':
-        api_token = os.environ.get('DO_API_TOKEN') or os.environ['DO_API_KEY']
-        do = DoManager(None, api_token, 2)
-    else:
-        client_id = os.environ['DO_CLIENT_ID']
-        api_key = os.environ['DO_API_KEY']
-        do = DoManager(client_id, api_key, 1)
-    import sys
-    fname = sys.argv[1]
-    import pprint
     # size_id: 66, image_id: 1601, region_id: 1
-    pprint.pprint(getattr(do, fname)(*sys.argv[2:]))
+    import sys
+    from dopy.cli import main
+    sys.exit(main())
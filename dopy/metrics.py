@@ -0,0 +1,155 @@
+#coding: utf-8
+"""
+Request instrumentation.
+
+Observers registered with DoManager.add_observer() are called with a
+RequestEvent after every v2 API request; EndpointStats is one of them,
+aggregating counts, bytes and latency histograms per endpoint.
+"""
+
+import bisect
+import threading
+
+from six.moves.urllib.parse import urlparse
+
+# Path segments naming what the next segment identifies; any other segment
+# that isn't a collection name is taken as an id.
+PLACEHOLDERS = {
+    'domains': '{name}',
+    'tags': '{name}',
+    'floating_ips': '{ip}',
+}
+COLLECTIONS = set([
+    'account', 'actions', 'droplets', 'domains', 'floating_ips', 'images',
+    'keys', 'records', 'regions', 'resources', 'sizes', 'tags',
+])
+
+
+def path_template(url):
+    """
+    'https://api.digitalocean.com/v2/droplets/42/actions' -> '/droplets/{id}/actions'
+    """
+    segments = [segment for segment in urlparse(url).path.split('/') if segment]
+    if segments and segments[0] in ('v1', 'v2'):
+        segments = segments[1:]
+
+    template = []
+    for index, segment in enumerate(segments):
+        if segment in COLLECTIONS:
+            template.append(segment)
+        elif index and segments[index - 1] in PLACEHOLDERS:
+            template.append(PLACEHOLDERS[segments[index - 1]])
+        else:
+            template.append('{id}')
+    return '/' + '/'.join(template)
+
+
+def endpoint_family(url):
+    """
+    'https://api.digitalocean.com/v2/droplets/42/actions' -> 'droplets'
+    """
+    return path_template(url).split('/')[1]
+
+
+class RequestEvent(object):
+    """
+    One request, as seen by the observers. The timings are in seconds: ttfb
+    until the response headers arrived (connection, request and server
+    time together), body for reading the rest, decode for parsing it.
+
+    The ttfb/body split is the transport's: requests reports when the
+    headers arrived, httpx only when the whole response did, so with
+    HttpxTransport ttfb covers the body too and body is about 0.
+    """
+    __slots__ = ('method', 'url', 'status', 'ttfb', 'body', 'decode',
+                 'bytes', 'page', 'retries', 'error')
+
+    def __init__(self, method, url, status, ttfb=0.0, body=0.0,
+            decode=0.0, bytes=0, page=1, retries=0, error=None):
+        self.method = method
+        self.url = url
+        self.status = status
+        self.ttfb = ttfb
+        self.body = body
+        self.decode = decode
+        self.bytes = bytes
+        self.page = page
+        self.retries = retries
+        self.error = error
+
+    @property
+    def path(self):
+        return path_template(self.url)
+
+    @property
+    def latency(self):
+        return self.ttfb + self.body + self.decode
+
+    def __repr__(self):
+        return '<RequestEvent %s %s %s %.1fms>' % (
+            self.method, self.path, self.status, self.latency * 1000)
+
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class EndpointStats(object):
+    """
+    Aggregates RequestEvents per method and path template.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.endpoints = {}  # (method, path) -> counters
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        key = (event.method, event.path)
+        with self._lock:
+            stats = self.endpoints.get(key)
+            if stats is None:
+                stats = self.endpoints[key] = {
+                    'count': 0, 'errors': 0, 'retries': 0, 'bytes': 0,
+                    'ttfb': 0.0, 'body': 0.0, 'decode': 0.0,
+                    'histogram': [0] * (len(self.buckets) + 1),
+                }
+            stats['count'] += 1
+            if event.error is not None or event.status is None or event.status >= 400:
+                stats['errors'] += 1
+            stats['retries'] += event.retries
+            stats['bytes'] += event.bytes
+            stats['ttfb'] += event.ttfb
+            stats['body'] += event.body
+            stats['decode'] += event.decode
+            stats['histogram'][bisect.bisect_left(self.buckets, event.latency)] += 1
+
+    def percentile(self, method, path, percent):
+        """
+        Upper bound of the bucket holding the given latency percentile.
+        """
+        histogram = self.endpoints[(method, path)]['histogram']
+        rank = sum(histogram) * percent / 100.0
+        seen = 0
+        for index, count in enumerate(histogram):
+            seen += count
+            if count and seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return 0.0
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for (method, path), stats in sorted(self.endpoints.items()):
+                count = stats['count']
+                rows.append({
+                    'method': method, 'path': path, 'count': count,
+                    'errors': stats['errors'], 'retries': stats['retries'],
+                    'bytes': stats['bytes'],
+                    'ttfb': stats['ttfb'] / count,
+                    'body': stats['body'] / count,
+                    'decode': stats['decode'] / count,
+                })
+        for row in rows:
+            row['p50'] = self.percentile(row['method'], row['path'], 50)
+            row['p99'] = self.percentile(row['method'], row['path'], 99)
+        return rows
@@ -0,0 +1,164 @@
+#coding: utf-8
+"""
+Compact resource objects, returned instead of dicts by a
+DoManager(..., models=True).
+
+The commonly used scalar fields are kept in __slots__; everything else (the
+nested networks, kernel, image, region...) is kept as one compact JSON blob
+and only decoded when first accessed. to_dict() gives back the API's dict.
+Items can still be read like dicts, e.g. droplet['name'].
+"""
+
+import json as json_module
+
+from six import iteritems
+from six.moves import intern
+
+_MISSING = object()
+
+
+class Model(object):
+    __slots__ = ('_blob', '_decoded')
+
+    fields = ()
+    # Fields holding a handful of distinct values (statuses, slugs), shared
+    # between instances instead of stored once per object.
+    interned = ()
+    # Nested objects decoded into models rather than plain data.
+    nested = {}
+
+    def __init__(self, data):
+        for name in self.fields:
+            value = data.get(name)
+            if name in self.interned and isinstance(value, str):
+                value = intern(value)
+            setattr(self, name, value)
+
+        rest = dict((key, value) for key, value in iteritems(data) if key not in self.fields)
+        self._blob = json_module.dumps(rest, separators=(',', ':')).encode('utf-8') if rest else None
+        self._decoded = None
+
+    def _rest(self):
+        if self._blob is None:
+            return {}
+        return json_module.loads(self._blob.decode('utf-8'))
+
+    def __getattr__(self, name):
+        # Only reached for names that aren't slots, i.e. the nested data.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        decoded = object.__getattribute__(self, '_decoded')
+        if decoded is not None and name in decoded:
+            return decoded[name]
+
+        value = self._rest().get(name, _MISSING)
+        if value is _MISSING:
+            raise AttributeError(name)
+        model = self.nested.get(name)
+        if model is not None and isinstance(value, dict):
+            value = model(value)
+
+        if decoded is None:
+            decoded = self._decoded = {}
+        decoded[name] = value
+        return value
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.fields or key in self._rest()
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        """
+        The resource as returned by the API.
+        """
+        data = self._rest()
+        for name in self.fields:
+            data[name] = getattr(self, name)
+        return data
+
+    raw = property(to_dict)
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        key = self.fields[0]
+        return '<%s %s=%r>' % (type(self).__name__, key, getattr(self, key))
+
+
+class Image(Model):
+    __slots__ = ('id', 'name', 'distribution', 'slug', 'public', 'type',
+                 'min_disk_size', 'size_gigabytes', 'created_at')
+    fields = __slots__
+    interned = ('distribution', 'type')
+
+
+class Droplet(Model):
+    __slots__ = ('id', 'name', 'status', 'memory', 'vcpus', 'disk', 'locked',
+                 'size_slug', 'tags', 'created_at', 'ip_address', 'private_ip_address')
+    fields = __slots__
+    interned = ('status', 'size_slug')
+    nested = {'image': Image}
+
+    def __init__(self, data):
+        Model.__init__(self, data)
+        # The same as DoManager.populate_droplet_ips, without the networks
+        # having to be decoded later on.
+        if self.ip_address is None and 'networks' in data:
+            self.ip_address = ''
+            for network in data['networks'].get('v4', ()):
+                if network['type'] == 'public':
+                    self.ip_address = network['ip_address']
+                if network['type'] == 'private':
+                    self.private_ip_address = network['ip_address']
+
+    def to_dict(self):
+        data = Model.to_dict(self)
+        if data['private_ip_address'] is None:
+            del data['private_ip_address']
+        return data
+
+    raw = property(to_dict)
+
+
+class DomainRecord(Model):
+    __slots__ = ('id', 'type', 'name', 'data', 'priority', 'port', 'ttl', 'weight')
+    fields = __slots__
+    interned = ('type',)
+
+
+class FloatingIP(Model):
+    __slots__ = ('ip', 'locked')
+    fields = __slots__
+    nested = {'droplet': Droplet}
+
+
+class Action(Model):
+    __slots__ = ('id', 'status', 'type', 'started_at', 'completed_at',
+                 'resource_id', 'resource_type', 'region_slug')
+    fields = __slots__
+    interned = ('status', 'type', 'resource_type', 'region_slug')
+
+
+MODELS = {
+    'droplet': Droplet,
+    'image': Image,
+    'domain_record': DomainRecord,
+    'floating_ip': FloatingIP,
+    'action': Action,
+}
@@ -0,0 +1,121 @@
+#coding: utf-8
+"""
+Creates many droplets at once and streams them back as they become usable.
+
+Names are sent in multi-create batches of up to MAX_BATCH per request, the
+batches in parallel. Each droplet's create action is handed to the manager's
+ActionWaiter; once it completes the droplet is fetched again (and re-fetched
+until it is active with a public IPv4 address), then yielded.
+"""
+
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from six.moves import queue
+
+from .manager import DoError
+
+# The most droplets the API creates in one request.
+MAX_BATCH = 10
+
+
+class ProvisionError(DoError):
+    """
+    Raised after every droplet that could be provisioned was yielded.
+    failures maps the failed batches (tuples of names), create actions
+    (action ids) or droplets (droplet ids) to their exception.
+    """
+    def __init__(self, failures):
+        DoError.__init__(self, '%d provisioning step(s) failed' % len(failures))
+        self.failures = failures
+
+
+def is_ready(droplet):
+    return droplet['status'] == 'active' and bool(droplet.get('ip_address'))
+
+
+def provision_droplets(manager, names, params, batch_size=MAX_BATCH, timeout=None,
+        max_workers=None):
+    """
+    Yields the droplets created from names, in the order they become ready.
+    params are the other create parameters, shared by every droplet.
+    """
+    names = list(names)
+    batch_size = max(1, min(batch_size, MAX_BATCH))
+    batches = [tuple(names[index:index + batch_size])
+               for index in range(0, len(names), batch_size)]
+    deadline = time.time() + timeout if timeout is not None else None
+    results = queue.Queue()  # (key, droplet or None, exception or None)
+    executor = ThreadPoolExecutor(max_workers or manager.max_workers)
+
+    def remaining():
+        return None if deadline is None else max(0, deadline - time.time())
+
+    def create(batch):
+        if len(batch) == 1:
+            json = manager.request('/droplets', dict(params, name=batch[0]), method='POST')
+            droplets = [json['droplet']]
+        else:
+            json = manager.request('/droplets', dict(params, names=list(batch)), method='POST')
+            droplets = json['droplets']
+        actions = [action for action in json.get('links', {}).get('actions', [])
+                   if action.get('rel', 'create') == 'create']
+        if len(actions) != len(droplets):
+            # Nothing to wait on: poll the droplets themselves.
+            for droplet in droplets:
+                executor.submit(fetch, droplet['id'], droplet['id'])
+            return
+        for action in actions:
+            manager.waiter.submit(action['id'], remaining(),
+                                  lambda future, id=action['id']: created(id, future))
+
+    def created(id, future):
+        error = future.exception()
+        if error is not None:
+            results.put((id, None, error))
+        else:
+            executor.submit(fetch, id, future.result()['resource_id'])
+
+    def fetch(key, droplet_id):
+        # Addresses can show up a moment after the create action completes.
+        delay = manager.waiter.interval
+        try:
+            while True:
+                droplet = manager.show_droplet(droplet_id)
+                if is_ready(droplet):
+                    results.put((key, droplet, None))
+                    return
+                if deadline is not None and time.time() + delay > deadline:
+                    raise DoError('Droplet %s was not ready in time' % droplet_id)
+                time.sleep(delay)
+                delay = min(delay * manager.waiter.backoff, manager.waiter.max_interval)
+        except Exception as e:
+            results.put((droplet_id, None, e))
+
+    def create_batch(batch):
+        try:
+            create(batch)
+        except Exception as e:
+            results.put((batch, None, e))
+
+    for batch in batches:
+        executor.submit(create_batch, batch)
+
+    # Every name ends up as one result, except for failed batches which
+    # stand for all of their names.
+    failures = {}
+    outstanding = len(names)
+    try:
+        while outstanding:
+            key, droplet, error = results.get()
+            if error is None:
+                outstanding -= 1
+                yield droplet
+            else:
+                outstanding -= len(key) if isinstance(key, tuple) else 1
+                failures[key] = error
+    finally:
+        executor.shutdown(wait=False)
+
+    if failures:
+        raise ProvisionError(failures)
@@ -0,0 +1,79 @@
+#coding: utf-8
+"""
+Client-side pacing for the v2 API rate limit.
+"""
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    """
+    Token bucket shared by every thread using one DoManager.
+
+    It starts from the documented limits (5000 requests per hour, 250 per
+    minute) and is then driven by the RateLimit-* headers of each response.
+    Requests go at the per-minute pace while the hourly budget lasts (or
+    faster, if what remains spread evenly until the reset allows it); once
+    less than a burst of it remains, the pace slides towards that spread.
+    """
+    def __init__(self, limit=5000, period=3600.0, burst=250, per_minute=250):
+        self.minute_rate = per_minute / 60.0
+        self.capacity = burst
+        self.rate = self._pace(limit, period)  # tokens per second
+        self.tokens = float(burst)
+        self.updated = time.time()
+        self.blocked_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent.
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+
+    def update(self, headers):
+        """
+        Adjusts the pace from the RateLimit-* headers of a response.
+        """
+        try:
+            remaining = int(headers['RateLimit-Remaining'])
+            reset = float(headers['RateLimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+            self.tokens = min(self.tokens, remaining)
+            if remaining <= 0:
+                self.blocked_until = max(self.blocked_until, reset)
+            else:
+                self.rate = self._pace(remaining, reset - now)
+
+    def block(self, seconds):
+        """
+        Holds every request back for the given number of seconds.
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def _pace(self, remaining, seconds_left):
+        spread = remaining / max(seconds_left, 1.0)
+        if spread >= self.minute_rate or remaining >= self.capacity:
+            # A window with more to spare than the per-minute pace (e.g. a
+            # short one) is spread evenly.
+            return max(spread, self.minute_rate)
+        return spread + (self.minute_rate - spread) * remaining / self.capacity
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
@@ -0,0 +1,145 @@
+#coding: utf-8
+"""
+Brings the records of a domain to a desired state with as few calls as
+possible: the current records are listed once, indexed by (type, name,
+data), and only the differences are sent, concurrently.
+"""
+
+from .manager import run_concurrently
+
+# Record attributes that can change without the record becoming another one.
+MUTABLE_FIELDS = ('priority', 'port', 'weight', 'ttl', 'flags', 'tag')
+# Types allowing a single record per name: a new value replaces the old
+# record in place rather than being created next to it.
+SINGLE_VALUED_TYPES = ('CNAME',)
+
+
+def record_key(record):
+    return (record['type'].upper(), record.get('name') or '@', str(record['data']))
+
+
+def is_zone_record(key):
+    """
+    The SOA and apex NS records, managed with the zone itself.
+    """
+    return key[0] == 'SOA' or (key[0] == 'NS' and key[1] == '@')
+
+
+def conflicts(key, other):
+    """
+    Whether records of these keys can't exist at the same time.
+    """
+    return key[1] == other[1] and (key[0] in SINGLE_VALUED_TYPES or
+                                   other[0] in SINGLE_VALUED_TYPES)
+
+
+class RecordPlan(object):
+    """
+    The calls needed to go from the current records to the desired ones.
+    """
+    def __init__(self, create=None, update=None, delete=None, unchanged=0):
+        self.create = create or []  # desired records
+        self.update = update or []  # (current record, changed fields)
+        self.delete = delete or []  # current records
+        self.unchanged = unchanged
+
+    def __len__(self):
+        return len(self.create) + len(self.update) + len(self.delete)
+
+    def lines(self):
+        for record in self.create:
+            yield '+ %s %s %s' % record_key(record)
+        for record, changes in self.update:
+            yield '~ %s %s %s %s' % (record_key(record) + (changes,))
+        for record in self.delete:
+            yield '- %s %s %s' % record_key(record)
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+
+def plan_records(current, desired, prune=True):
+    """
+    Compares records; desired ones only need type, name and data. Records
+    present but not desired are deleted when prune is set, except the SOA
+    and apex NS records unless desired lists some of the same type and name.
+    A CNAME whose data changes is updated in place.
+    """
+    index = {}
+    for record in current:
+        index.setdefault(record_key(record), []).append(record)
+
+    plan = RecordPlan()
+    for record in desired:
+        matches = index.get(record_key(record))
+        if not matches:
+            plan.create.append(record)
+            continue
+        existing = matches.pop(0)
+        changes = dict((field, record[field]) for field in MUTABLE_FIELDS
+                       if field in record and record[field] != existing.get(field))
+        if changes:
+            plan.update.append((existing, changes))
+        else:
+            plan.unchanged += 1
+
+    # Left over: not desired, or duplicates of a desired record.
+    leftovers = [record for records in index.values() for record in records]
+    for record in list(plan.create):
+        key = record_key(record)
+        if key[0] not in SINGLE_VALUED_TYPES:
+            continue
+        for existing in leftovers:
+            if record_key(existing)[:2] == key[:2]:
+                leftovers.remove(existing)
+                plan.create.remove(record)
+                changes = dict((field, record[field]) for field in MUTABLE_FIELDS
+                               if field in record and record[field] != existing.get(field))
+                changes['data'] = record['data']
+                plan.update.append((existing, changes))
+                break
+
+    if prune:
+        desired_names = set(record_key(record)[:2] for record in desired)
+        plan.delete = [record for record in leftovers
+                       if not is_zone_record(record_key(record))
+                       or record_key(record)[:2] in desired_names]
+    return plan
+
+
+def reconcile_records(manager, domain, desired, dry_run=False, prune=True, max_workers=None):
+    """
+    Returns (plan, results, errors). results and errors are keyed by
+    ('create', (type, name, data)), ('update', id) or ('delete', id); with
+    dry_run nothing is sent and both are empty.
+    """
+    current = list(manager.iter_domain_records(domain))
+    plan = plan_records(current, desired, prune)
+    if dry_run or not plan:
+        return plan, {}, {}
+
+    path = '/domains/%s/records' % domain
+    calls = {}
+    for record in plan.create:
+        calls[('create', record_key(record))] = (
+            path, dict(record, type=record['type'].upper()), 'POST')
+    for record, changes in plan.update:
+        calls[('update', record['id'])] = ('%s/%s' % (path, record['id']), changes, 'PUT')
+    for record in plan.delete:
+        calls[('delete', record['id'])] = ('%s/%s' % (path, record['id']), {}, 'DELETE')
+
+    def send(key):
+        path, params, method = calls[key]
+        return manager.request(path, params, method=method)
+
+    # A CNAME can't share its name with any other record: deletes making
+    # room for a create go first.
+    first = [('delete', record['id']) for record in plan.delete
+             if any(conflicts(record_key(record), record_key(created))
+                    for created in plan.create)]
+    results, errors = run_concurrently(send, first, max_workers or manager.max_workers)
+    rest = [key for key in calls if key not in results and key not in errors]
+    more_results, more_errors = run_concurrently(send, rest, max_workers or manager.max_workers)
+    results.update(more_results)
+    errors.update(more_errors)
+    return plan, results, errors
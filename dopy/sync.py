@@ -0,0 +1,171 @@
+#coding: utf-8
+"""
+Keeps an in-memory copy of an account's inventory up to date.
+
+After a first full load, refresh() only reads the /actions feed since the
+last action it saw and re-fetches the droplets (and floating IPs) those
+actions touched, so its cost follows the churn rather than the fleet size.
+Tags and domain records don't show up in the feed; they are reloaded on full
+refreshes only, which full_refresh_every schedules periodically.
+"""
+
+import threading
+from collections import namedtuple
+
+from .manager import NotFound, run_concurrently
+
+ADDED = 'added'
+REMOVED = 'removed'
+UPDATED = 'updated'
+
+Event = namedtuple('Event', 'kind resource_type key old new')
+
+
+class InventorySync(object):
+    def __init__(self, manager, domains=(), full_refresh_every=None):
+        self.manager = manager
+        self.domains = list(domains)  # the domains whose records are tracked
+        self.full_refresh_every = full_refresh_every
+
+        self.droplets = {}  # id -> droplet
+        self.floating_ips = {}  # ip -> floating ip
+        self.tags = {}  # name -> tag
+        self.domain_records = dict((domain, {}) for domain in self.domains)  # domain -> id -> record
+        self.tagged = {}  # tag name -> set of droplet ids
+
+        self.last_action_id = None
+        self.unfinished = set()  # ids of actions still in progress
+        self.refreshes = 0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        Calls callback(event) for every change found by refresh().
+        """
+        self._listeners.append(callback)
+
+    def droplets_with_tag(self, name):
+        return [self.droplets[id] for id in self.tagged.get(name, ())]
+
+    def refresh(self, full=False):
+        """
+        Brings the snapshot up to date and returns the list of changes.
+        """
+        with self._lock:
+            full = full or self.last_action_id is None or (
+                self.full_refresh_every and self.refreshes % self.full_refresh_every == 0)
+            events = self._full_refresh() if full else self._incremental_refresh()
+            self.refreshes += 1
+
+        for event in events:
+            for callback in self._listeners:
+                callback(event)
+        return events
+
+    def _full_refresh(self):
+        # Read the feed position first, so nothing happening during the
+        # load is missed by the next incremental refresh.
+        actions = self._new_actions()
+
+        events = []
+        droplets = dict((droplet['id'], droplet) for droplet in self.manager.iter_droplets())
+        events.extend(self._replace('droplet', self.droplets, droplets))
+        events.extend(self._replace_floating_ips())
+        tags = dict((tag['name'], tag) for tag in self.manager.iter_tags())
+        events.extend(self._replace('tag', self.tags, tags))
+        for domain in self.domains:
+            records = dict((record['id'], record)
+                           for record in self.manager.iter_domain_records(domain))
+            events.extend(self._replace('domain_record', self.domain_records[domain], records))
+
+        self._advance(actions)
+        return events
+
+    def _incremental_refresh(self):
+        actions = self._new_actions()
+        droplet_ids = set(action['resource_id'] for action in actions
+                          if action.get('resource_type') == 'droplet')
+        floating_ips_changed = any(action.get('resource_type') == 'floating_ip'
+                                   for action in actions)
+
+        events = []
+        if droplet_ids:
+            results, errors = run_concurrently(
+                self.manager.show_droplet, droplet_ids, self.manager.max_workers)
+            for droplet_id, error in errors.items():
+                # Anything but a 404 (server errors, rate limits, an open
+                # circuit) leaves the feed position alone, so the same
+                # actions are looked at again by the next refresh.
+                if not isinstance(error, NotFound):
+                    raise error
+                results[droplet_id] = None  # destroyed
+            for droplet_id, droplet in results.items():
+                events.extend(self._set('droplet', self.droplets, droplet_id, droplet))
+            floating_ips_changed = True  # follow droplets being destroyed or created
+        if floating_ips_changed:
+            events.extend(self._replace_floating_ips())
+
+        self._advance(actions)
+        return events
+
+    def _new_actions(self):
+        """
+        Actions newer than the last one seen, plus those seen unfinished
+        before, newest first.
+        """
+        if self.last_action_id is None:
+            page = next(self.manager.iter_request('/actions', {'per_page': 1}), {})
+            return page.get('actions', [])[:1]
+
+        oldest = min(self.unfinished | set([self.last_action_id]))
+        actions = []
+        for page in self.manager.iter_request('/actions', {'per_page': 200}):
+            page_actions = page.get('actions', [])
+            actions.extend(action for action in page_actions
+                           if action['id'] > self.last_action_id
+                           or action['id'] in self.unfinished)
+            if not page_actions or page_actions[-1]['id'] <= oldest:
+                break
+        return actions
+
+    def _advance(self, actions):
+        # From an empty feed too, so the next refresh is an incremental one.
+        self.last_action_id = max([self.last_action_id or 0] +
+                                  [action['id'] for action in actions])
+        self.unfinished = set(action['id'] for action in actions
+                              if action.get('status') == 'in-progress')
+
+    def _replace_floating_ips(self):
+        floating_ips = dict((floating_ip['ip'], floating_ip)
+                            for floating_ip in self.manager.iter_floating_ips())
+        return self._replace('floating_ip', self.floating_ips, floating_ips)
+
+    def _replace(self, resource_type, current, latest):
+        events = []
+        for key in set(current) - set(latest):
+            events.extend(self._set(resource_type, current, key, None))
+        for key, resource in latest.items():
+            events.extend(self._set(resource_type, current, key, resource))
+        return events
+
+    def _set(self, resource_type, current, key, resource):
+        old = current.get(key)
+        if old == resource:
+            return []
+
+        if resource is None:
+            del current[key]
+        else:
+            current[key] = resource
+        if resource_type == 'droplet':
+            self._index_tags(key, old, resource)
+
+        kind = ADDED if old is None else REMOVED if resource is None else UPDATED
+        return [Event(kind, resource_type, key, old, resource)]
+
+    def _index_tags(self, droplet_id, old, new):
+        for name in (old or {}).get('tags', ()):
+            self.tagged.get(name, set()).discard(droplet_id)
+        for name in (new or {}).get('tags', ()):
+            self.tagged.setdefault(name, set()).add(droplet_id)
@@ -0,0 +1,111 @@
+#coding: utf-8
+"""
+The HTTP clients a DoManager can send its requests through.
+
+RequestsTransport, the default, keeps a pool of HTTP/1.1 connections per
+host. HttpxTransport speaks HTTP/2 when the server offers it, multiplexing
+concurrent requests (parallel pages, batch actions) over a single
+connection (``pip install dopy[http2]``). Both always ask for compressed
+responses: brotli when a brotli package is installed, gzip otherwise.
+
+A transport takes request(method, url, headers, params, data, timeout),
+with timeout a (connect, read) pair, and returns a response with
+status_code, headers, content and elapsed. Its errors attribute lists the
+exceptions it raises for connection failures and timeouts.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import brotli  # noqa: F401, used by both clients to decode br bodies
+    ACCEPT_ENCODING = 'br, gzip, deflate'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'br, gzip, deflate'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_POOL_SIZE = 10
+
+
+class RequestsTransport(object):
+    errors = (requests.RequestException,)
+
+    def __init__(self, session=None, pool_size=DEFAULT_POOL_SIZE):
+        # A caller-supplied session is used as is and left open on close().
+        self._owns_session = session is None
+        if session is None:
+            session = self.create_session(pool_size)
+        self.session = session
+
+    @staticmethod
+    def create_session(pool_size=DEFAULT_POOL_SIZE):
+        """
+        Builds a keep-alive session whose connection pool holds up to
+        pool_size connections per host.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        return session
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        return self.session.request(method, url, headers=headers, params=params,
+                                    data=data, timeout=timeout)
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
+
+
+class HttpxTransport(object):
+    def __init__(self, client=None, pool_size=DEFAULT_POOL_SIZE, http2=True, http1=True):
+        """
+        http1=False talks HTTP/2 to plain http:// servers from the start
+        (prior knowledge), e.g. a local test server.
+        """
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+        if httpx is None or (client is None and http2 and not h2_installed()):
+            from .manager import DoError
+            raise DoError('HttpxTransport requires httpx with HTTP/2 support, '
+                'install it with `pip install dopy[http2]`.')
+        self.httpx = httpx
+        self.errors = (httpx.RequestError,)
+
+        self._owns_client = client is None
+        if client is None:
+            limits = httpx.Limits(max_connections=pool_size,
+                                  max_keepalive_connections=pool_size)
+            options = {} if http1 else {'http1': False}
+            client = httpx.Client(http2=http2, limits=limits,
+                                  headers={'Accept-Encoding': ACCEPT_ENCODING}, **options)
+        self.client = client
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        if params:
+            # Keep the query already in url, e.g. ?page=2 of a page link.
+            url = self.httpx.URL(url).copy_merge_params(params)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = self.httpx.Timeout(read, connect=connect)
+        return self.client.request(method, url, headers=headers, content=data,
+                                   timeout=timeout)
+
+    def close(self):
+        if self._owns_client:
+            self.client.close()
+
+
+def h2_installed():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,175 @@
+#coding: utf-8
+"""
+Waits for v2 API actions to complete.
+
+Pending actions are checked together from one background thread: with a
+handful of them each is fetched on its own, with more the account's /actions
+feed is paged through instead, which finds them all in a few requests.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import Future, wait
+
+from .manager import DoError
+from .models import Model
+
+DONE_STATUSES = ('completed', 'errored')
+
+
+class ActionTimeout(DoError):
+    pass
+
+
+def action_id(action):
+    """
+    Accepts an action id, an action (dict or model), or a response wrapping one.
+    """
+    if isinstance(action, dict):
+        action = action.get('action', action)
+        return action['id']
+    if isinstance(action, Model):
+        return action['id']
+    return action
+
+
+class ActionWaiter(object):
+    def __init__(self, manager, interval=1.0, max_interval=30.0, backoff=1.5,
+            jitter=0.2, bulk_threshold=5):
+        self.manager = manager
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        # From this many pending actions on, poll through /actions.
+        self.bulk_threshold = bulk_threshold
+
+        self._pending = {}  # action id -> [(future, deadline), ...]
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def submit(self, action, timeout=None, callback=None):
+        """
+        Returns a future resolved with the action once it completes.
+
+        The future fails with DoError if the action errored, or with
+        ActionTimeout if it is still running after timeout seconds.
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        deadline = time.time() + timeout if timeout is not None else None
+
+        with self._lock:
+            self._pending.setdefault(action_id(action), []).append((future, deadline))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return future
+
+    def wait(self, actions, timeout=None):
+        """
+        Blocks until every action completed and returns them, in order.
+        """
+        futures = [self.submit(action, timeout) for action in actions]
+        wait(futures)
+        return [future.result() for future in futures]
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                pending = dict((id, list(waiters))
+                               for id, waiters in self._pending.items())
+
+            try:
+                statuses = self.fetch_statuses(list(pending))
+            except Exception:
+                statuses = {}  # try again on the next round
+
+            try:
+                self._settle(pending, statuses)
+            except Exception:
+                pass  # a bad round must not stop the thread; the next one retries
+
+            # A new submission restarts the backoff from the base interval.
+            sleep = delay * (1 + random.uniform(-self.jitter, self.jitter))
+            if self._wakeup.wait(sleep):
+                self._wakeup.clear()
+                delay = self.interval
+            else:
+                delay = min(delay * self.backoff, self.max_interval)
+
+    def _settle(self, pending, statuses):
+        now = time.time()
+        for id, waiters in pending.items():
+            action = statuses.get(id)
+            for future, deadline in waiters:
+                if future.cancelled():
+                    self._resolve(id, future)
+                elif action is not None and action['status'] in DONE_STATUSES:
+                    self._resolve(id, future)
+                    if action['status'] == 'completed':
+                        self._set(future, action)
+                    else:
+                        self._set(future, error=DoError('Action %s errored' % id))
+                elif deadline is not None and now >= deadline:
+                    self._resolve(id, future)
+                    self._set(future, error=ActionTimeout(
+                        'Action %s did not complete in time' % id))
+
+    @staticmethod
+    def _set(future, result=None, error=None):
+        # The caller may cancel the future between the cancelled() check
+        # and now, making it refuse any outcome.
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except Exception:
+            pass
+
+    def _resolve(self, id, future):
+        with self._lock:
+            waiters = [waiter for waiter in self._pending.get(id, ())
+                       if waiter[0] is not future]
+            if waiters:
+                self._pending[id] = waiters
+            else:
+                self._pending.pop(id, None)
+
+    def fetch_statuses(self, ids):
+        """
+        Returns the current state of the given actions, keyed by id.
+        """
+        found = {}
+        if len(ids) >= self.bulk_threshold:
+            # The ids as submitted (e.g. strings from the command line) by
+            # their value in the feed.
+            wanted = dict((int(id), id) for id in ids)
+            oldest = min(wanted)
+            # The feed lists the most recent actions first.
+            for page in self.manager.iter_request('/actions', {'per_page': 200}):
+                actions = page.get('actions', [])
+                for action in actions:
+                    if action['id'] in wanted:
+                        found[wanted[action['id']]] = self.manager.model('action', action)
+                if len(found) == len(wanted) or not actions \
+                        or min(action['id'] for action in actions) <= oldest:
+                    break
+
+        for id in ids:
+            if id not in found:
+                try:
+                    found[id] = self.manager.show_action(id)
+                except (DoError, RuntimeError):
+                    pass  # checked again on the next round
+        return found
@@ -0,0 +1,25 @@
+#coding: utf-8
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from dopy.manager import DoManager  # noqa: E402
+from fakeserver import FakeServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    server = FakeServer(droplets=10, records=0, floating_ips=2).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def do(server):
+    with DoManager(None, 'token', 2, api_endpoint=server.endpoint, max_retries=0) as do:
+        yield do
@@ -0,0 +1,51 @@
+#coding: utf-8
+import pytest
+
+from dopy.breaker import CircuitBreaker, CircuitBreakers, CircuitOpen
+from dopy.manager import DoError, DoManager
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('dopy.breaker.time.time', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()  # resets the count
+    breaker.failure()
+    breaker.failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.failure()
+    assert breaker.is_open and not breaker.allow()
+
+
+def test_lets_one_trial_through_after_reset_timeout(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('dopy.breaker.time.time', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    now[0] += 31
+    assert breaker.allow()
+    assert not breaker.allow()  # the others wait for the trial
+    breaker.failure()  # the trial failed: open for another reset_timeout
+    now[0] += 29
+    assert not breaker.allow()
+    now[0] += 2
+    assert breaker.allow()
+    breaker.success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_manager_fails_fast_per_family(server):
+    server.errors[('GET', '/v2/droplets/1')] = 500
+    do = DoManager(None, 'token', 2, api_endpoint=server.endpoint, max_retries=0,
+                   circuit_breakers=CircuitBreakers(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(DoError):
+            do.show_droplet(1)
+    with pytest.raises(CircuitOpen):
+        do.show_droplet(2)
+    assert server.requests[('GET', '/v2/droplets/1')] == 2
+    assert ('GET', '/v2/droplets/2') not in server.requests
+    assert do.circuit_breakers.open_families() == ['droplets']
+    do.request('/actions')  # other families are unaffected
@@ -0,0 +1,84 @@
+#coding: utf-8
+import json
+import os
+
+from dopy.cache import DiskCache, MemoryCache, ResponseCache
+from dopy.manager import DoManager
+
+
+def test_ttl_covers_collections_and_their_items_only():
+    cache = ResponseCache()
+    assert cache.ttl('/images') == cache.ttl('/images/5') == 3600
+    assert cache.ttl('/account/keys/3') == 3600
+    assert cache.ttl('/images/5/actions') is None
+    assert cache.ttl('/images/5/destroy') is None
+    assert cache.ttl('/droplets') is None
+
+
+def test_entries_round_trip_through_the_codec():
+    backend = MemoryCache()
+    cache = ResponseCache(backend, codec='json')
+    cache.set('scope', '/sizes', {}, {'sizes': [{'slug': '1gb'}]})
+    assert cache.get('scope', '/sizes', {}) == {'sizes': [{'slug': '1gb'}]}
+    assert cache.get('other', '/sizes', {}) is None
+
+
+def test_mutations_invalidate_the_family(do, server):
+    do.cache = ResponseCache(ttls={'/droplets': 60})
+    do.request('/droplets/1')
+    do.request('/droplets/1')
+    assert server.requests[('GET', '/v2/droplets/1')] == 1
+
+    do.reboot_droplet(1)
+    do.request('/droplets/1')
+    assert server.requests[('GET', '/v2/droplets/1')] == 2
+
+
+class Response(object):
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+class Transport(object):
+    errors = (IOError,)
+
+    def __init__(self):
+        self.urls = []
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        self.urls.append(url)
+        return Response(json.dumps({'status': 'OK', 'images': [{'id': 5}]}).encode('utf-8'))
+
+    def close(self):
+        pass
+
+
+def test_v1_mutations_are_never_cached():
+    transport = Transport()
+    do = DoManager('client', 'key', 1, transport=transport, cache=True)
+    do.all_images()
+    do.all_images()
+    assert len(transport.urls) == 1
+
+    do.destroy_image(5)
+    do.destroy_image(5)
+    do.transfer_image(5, 2)
+    do.transfer_image(5, 2)
+    assert len(transport.urls) == 5
+
+    do.all_images()  # the mutations dropped the cached listing
+    assert len(transport.urls) == 6
+
+
+def test_disk_cache_is_bounded_in_bytes(tmpdir):
+    cache = DiskCache(str(tmpdir), max_entries=100, max_bytes=2500)
+    for index in range(5):
+        cache.set('sizes|%d' % index, b'x' * 1000, 60, 'sizes')
+        os.utime(cache.path('sizes|%d' % index, 'sizes'), (index, index))  # distinct ages
+    assert [cache.get('sizes|%d' % index) is not None for index in range(5)] == \
+        [False, False, False, True, True]
+    cache.set('sizes|big', b'x' * 3000, 60, 'sizes')
+    assert cache.get('sizes|big') is None
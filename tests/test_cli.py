@@ -0,0 +1,40 @@
+#coding: utf-8
+import io
+import json
+
+from dopy.cli import parse_commands, run_batch
+
+
+def test_parse_commands_reports_malformed_lines():
+    lines = ['show_droplet 1\n', '# a comment\n', '\n', 'show_droplet "2\n', "rename 3 'a b'\n"]
+    assert list(parse_commands(lines)) == [
+        (1, 'show_droplet', ['1']),
+        (4, None, 'ValueError: No closing quotation'),
+        (5, 'rename', ['3', 'a b']),
+    ]
+
+
+def test_run_batch_writes_a_line_per_command(do):
+    lines = ['show_droplet 1', 'show_droplet "2', 'show_droplet 999', '_private', 'show_droplet 3']
+    out = io.StringIO()
+    failed = run_batch(do, parse_commands(lines), 4, out)
+    results = dict((line['line'], line) for line in map(json.loads, out.getvalue().splitlines()))
+    assert failed == 3
+    assert results[1]['result']['id'] == 1 and results[5]['result']['id'] == 3
+    assert results[2] == {'line': 2, 'error': 'ValueError: No closing quotation'}
+    assert results[3]['error'].startswith('NotFound')
+    assert results[4]['error'].startswith('AttributeError')
+
+
+def test_run_batch_writes_results_before_the_input_ends(do):
+    out = io.StringIO()
+
+    def lines():
+        for number in range(1, 11):
+            yield 'show_droplet %d' % number
+        # Everything but the last two workers' worth of commands is out.
+        assert len(out.getvalue().splitlines()) >= 6
+        yield 'show_droplet 1'
+
+    assert run_batch(do, parse_commands(lines()), 2, out) == 0
+    assert len(out.getvalue().splitlines()) == 11
@@ -0,0 +1,19 @@
+#coding: utf-8
+from dopy.failover import FloatingIPFailover
+
+IP = '45.55.0.0'  # on droplet 1
+
+
+def test_a_failed_move_leaves_the_mapping_unchanged(do, server):
+    failover = FloatingIPFailover(do, interval=0.05)
+    failover.refresh()
+    server.fleet.action_delay = 5
+    move = failover.move(IP, 3, timeout=0.3)
+    assert move.error is not None
+    assert failover.assigned_to(IP) == 1
+
+    server.fleet.action_delay = 0
+    move = failover.move(IP, 3, timeout=5)
+    assert move.error is None
+    assert failover.assigned_to(IP) == 3
+    assert server.requests[('POST', '/v2/floating_ips/%s/actions' % IP)] == 2
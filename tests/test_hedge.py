@@ -0,0 +1,21 @@
+#coding: utf-8
+import time
+
+from dopy.hedge import Hedger
+from dopy.manager import DoManager
+
+
+def test_manager_sizes_the_hedge_pool_from_its_connection_pool():
+    do = DoManager(None, 'token', 2, pool_size=3, hedge=True)
+    assert do.hedger.max_workers == 6
+    assert DoManager(None, 'token', 2, hedge=Hedger(max_workers=4)).hedger.max_workers == 4
+
+
+def test_the_delay_counts_from_when_the_request_starts_running():
+    hedger = Hedger(min_samples=1, max_workers=1)
+    hedger.send('droplets', lambda: None)
+    hedger.record('droplets', 0.05)
+    hedger._executor.submit(time.sleep, 0.3)  # the only thread is busy
+    assert hedger.send('droplets', lambda: time.sleep(0.01) or 'first', lambda: 'second') == 'first'
+    assert hedger.hedged == 0
+    hedger.close()
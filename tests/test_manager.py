@@ -0,0 +1,147 @@
+#coding: utf-8
+import datetime
+import json
+import threading
+import time
+
+from dopy.manager import DoManager, merge_pages
+
+
+def manager(server, **options):
+    return DoManager(None, 'token', 2, api_endpoint=server.endpoint, max_retries=0, **options)
+
+
+def test_pages_are_fetched_concurrently_and_merged_in_order(server):
+    server.latency = 0.2
+    do = manager(server, per_page=3, max_workers=4, validators=False)
+    started = time.time()
+    droplets = do.all_active_droplets()
+    # One page, then the other three at once: two round trips, not four.
+    assert time.time() - started < 0.7
+    assert [droplet['id'] for droplet in droplets] == list(range(1, 11))
+    assert server.requests[('GET', '/v2/droplets/')] == 4
+
+
+def test_iter_droplets_streams_page_by_page(server):
+    do = manager(server, per_page=3)
+    droplets = do.iter_droplets()
+    assert next(droplets)['id'] == 1
+    assert server.requests[('GET', '/v2/droplets/')] == 1  # the rest not fetched yet
+    assert [droplet['id'] for droplet in droplets] == list(range(2, 11))
+    assert server.requests[('GET', '/v2/droplets/')] == 4
+
+
+def test_batch_action_sends_one_request_per_droplet(do, server):
+    results, errors = do.batch_droplet_action([1, 2, 3, 999], 'reboot')
+    assert sorted(results) == [1, 2, 3]
+    assert list(errors) == [999]
+    assert server.requests[('POST', '/v2/droplets/1/actions')] == 1
+
+
+def test_batch_action_with_a_tag_covering_other_droplets(do, server):
+    # 2, 4... are tagged web: the tag endpoint would reboot all five.
+    results, errors = do.batch_droplet_action([2, 4], 'reboot', tag_name='web')
+    assert sorted(results) == [2, 4] and not errors
+    assert ('POST', '/v2/droplets/actions') not in server.requests
+    assert server.requests[('POST', '/v2/droplets/2/actions')] == 1
+
+
+def test_batch_action_with_a_tag_covering_exactly_the_targets(do, server):
+    web = [droplet['id'] for droplet in do.iter_droplets(tag_name='web')]
+    results, errors = do.batch_droplet_action([str(id) for id in web], 'reboot', tag_name='web')
+    assert sorted(results) == sorted(str(id) for id in web) and not errors
+    assert server.requests[('POST', '/v2/droplets/actions')] == 1
+    assert not [key for key in server.requests if key[1].endswith('/2/actions')]
+
+
+def test_tag_action_quotes_the_tag(do, server):
+    server.fleet.droplets[1]['tags'].append('a&b c')
+    actions = do.tag_droplet_action('a&b c', 'reboot')
+    assert [action['resource_id'] for action in actions] == [1]
+
+
+def test_unchanged_listing_is_served_from_the_stored_body(server):
+    do = manager(server)
+    statuses = []
+    do.add_observer(lambda event: statuses.append(event.status))
+    first = do.all_active_droplets()
+    second = do.all_active_droplets()
+    assert statuses == [200, 304]
+    assert second == first and second is not first
+
+
+class Response(object):
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.elapsed = datetime.timedelta(0)
+
+
+class Transport(object):
+    errors = (IOError,)
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def request(self, method, url, headers=None, params=None, data=None, timeout=None):
+        self.headers.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_non_ascii_validators_are_kept():
+    body = json.dumps({'droplet': {'id': 1, 'networks': {}}}).encode('utf-8')
+    transport = Transport(Response(200, body, {'ETag': u'"caf\xe9"'}), Response(304))
+    do = DoManager(None, 'token', 2, transport=transport)
+    assert do.request('/droplets/1') == do.request('/droplets/1')
+    assert transport.headers[1]['If-None-Match'] == u'"caf\xe9"'
+
+
+def test_a_304_with_nothing_stored_is_fetched_again():
+    body = json.dumps({'droplet': {'id': 1}}).encode('utf-8')
+    transport = Transport(Response(304), Response(200, body))
+    do = DoManager(None, 'token', 2, transport=transport)
+    assert do.request('/droplets/1') == {'droplet': {'id': 1}}
+    assert transport.headers[1]['Cache-Control'] == 'no-cache'
+
+
+
+def test_identical_concurrent_gets_share_one_request(do, server):
+    server.latency = 0.3
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(do.request('/droplets/2')))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert server.requests[('GET', '/v2/droplets/2')] == 1
+    assert len(results) == 8
+    results[0]['droplet']['name'] = 'changed'
+    assert [result['droplet']['name'] for result in results[1:]] == \
+        [server.fleet.droplets[2]['name']] * 7
+
+
+def test_merge_pages_fills_the_presized_list():
+    pages = [
+        {'droplets': [1, 2], 'meta': {'total': 5}, 'links': {'pages': {'next': 'p2'}}},
+        {'droplets': [3, 4], 'meta': {'total': 5}, 'links': {'pages': {'next': 'p3'}}},
+        {'droplets': [5], 'meta': {'total': 5}, 'links': {}},
+    ]
+    assert merge_pages(pages) == {'droplets': [1, 2, 3, 4, 5], 'meta': {'total': 5}, 'links': {}}
+
+
+def test_merge_pages_follows_a_listing_that_changed_size():
+    shrunk = [{'droplets': [1, 2], 'meta': {'total': 5}}, {'droplets': [3]}]
+    assert merge_pages(shrunk)['droplets'] == [1, 2, 3]
+    grown = [{'droplets': [1], 'meta': {'total': 2}}, {'droplets': [2, 3]}]
+    assert merge_pages(grown)['droplets'] == [1, 2, 3]
+
+
+def test_merge_pages_without_envelope():
+    pages = [{'droplets': [1], 'meta': {'total': 1}, 'links': {}}, None]
+    assert merge_pages(pages, envelope=False) == {'droplets': [1]}
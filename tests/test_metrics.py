@@ -0,0 +1,20 @@
+#coding: utf-8
+from dopy.metrics import EndpointStats, path_template
+
+
+def test_path_template():
+    assert path_template('https://api.digitalocean.com/v2/droplets/42/actions') == \
+        '/droplets/{id}/actions'
+    assert path_template('/v2/domains/example.com/records/7') == '/domains/{name}/records/{id}'
+
+
+def test_endpoint_stats_aggregate_the_requests(do):
+    stats = EndpointStats()
+    events = []
+    do.add_observer(stats)
+    do.add_observer(events.append)
+    do.show_droplet(1)
+    do.show_droplet(2)
+    row = [row for row in stats.summary() if row['path'] == '/droplets/{id}'][0]
+    assert row['count'] == 2 and row['errors'] == 0 and row['bytes'] > 0
+    assert all(event.ttfb >= 0 and event.body >= 0 and event.latency > 0 for event in events)
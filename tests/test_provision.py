@@ -0,0 +1,10 @@
+#coding: utf-8
+
+
+def test_names_are_created_ten_per_request_and_yielded_when_ready(do, server):
+    server.fleet.action_delay = 0.1
+    names = ['node-%d' % index for index in range(23)]
+    droplets = list(do.provision_droplets(names, '1gb', 'ubuntu-16-04-x64', 'nyc3', timeout=10))
+    assert server.requests[('POST', '/v2/droplets')] == 3
+    assert sorted(droplet['name'] for droplet in droplets) == sorted(names)
+    assert all(droplet['status'] == 'active' and droplet['ip_address'] for droplet in droplets)
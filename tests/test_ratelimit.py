@@ -0,0 +1,39 @@
+#coding: utf-8
+import time
+
+from dopy.ratelimit import RateLimiter
+
+
+def update(limiter, remaining, seconds_left=3000):
+    limiter.update({'RateLimit-Remaining': str(remaining),
+                    'RateLimit-Reset': str(time.time() + seconds_left)})
+    return limiter.rate
+
+
+def test_keeps_the_per_minute_pace_while_the_budget_lasts():
+    limiter = RateLimiter()
+    assert abs(limiter.rate - 250 / 60.0) < 1e-9
+    assert abs(update(limiter, 4740) - 250 / 60.0) < 1e-9
+    assert abs(update(limiter, 250) - 250 / 60.0) < 1e-9
+
+
+def test_slows_down_as_the_budget_runs_out():
+    limiter = RateLimiter()
+    rates = [update(limiter, remaining) for remaining in (200, 100, 10, 1)]
+    assert rates == sorted(rates, reverse=True)
+    assert rates[-1] < 0.05
+
+
+def test_blocks_until_reset_once_spent():
+    limiter = RateLimiter()
+    update(limiter, 0, 30)
+    assert limiter.blocked_until > time.time() + 20
+    assert limiter.tokens == 0
+
+
+def test_bursts_without_waiting(server, do):
+    started = time.time()
+    for _ in range(50):
+        do.request('/actions')
+    assert time.time() - started < 5
+    assert do.rate_limiter.rate > 4
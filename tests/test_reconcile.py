@@ -0,0 +1,49 @@
+#coding: utf-8
+from dopy.reconcile import plan_records, reconcile_records
+
+SOA = {'id': 1, 'type': 'SOA', 'name': '@', 'data': '1800'}
+NS = {'id': 2, 'type': 'NS', 'name': '@', 'data': 'ns1.digitalocean.com'}
+WWW = {'id': 3, 'type': 'CNAME', 'name': 'www', 'data': 'a.example.com.'}
+
+
+def test_unchanged_updated_created_and_pruned():
+    current = [{'id': 4, 'type': 'A', 'name': 'a', 'data': '1.1.1.1', 'ttl': 1800},
+               {'id': 5, 'type': 'A', 'name': 'a', 'data': '1.1.1.1', 'ttl': 1800},
+               {'id': 6, 'type': 'A', 'name': 'b', 'data': '2.2.2.2', 'ttl': 1800}]
+    desired = [{'type': 'a', 'name': 'a', 'data': '1.1.1.1', 'ttl': 300},
+               {'type': 'A', 'name': 'c', 'data': '3.3.3.3'}]
+    plan = plan_records(current, desired)
+    assert [record['name'] for record in plan.create] == ['c']
+    assert plan.update == [(current[0], {'ttl': 300})]
+    assert sorted(record['id'] for record in plan.delete) == [5, 6]
+    assert not plan_records(current, desired, prune=False).delete
+
+
+def test_zone_records_are_not_pruned():
+    plan = plan_records([SOA, NS, WWW], [])
+    assert plan.delete == [WWW]
+
+
+def test_zone_records_listed_explicitly_are_reconciled():
+    plan = plan_records([SOA, NS], [{'type': 'NS', 'name': '@', 'data': 'ns2.digitalocean.com'}])
+    assert plan.delete == [NS]
+    assert len(plan.create) == 1
+
+
+def test_a_changed_cname_is_updated_in_place():
+    plan = plan_records([SOA, NS, WWW], [{'type': 'CNAME', 'name': 'www', 'data': 'b.example.com.'}])
+    assert not plan.create and not plan.delete
+    assert plan.update == [(WWW, {'data': 'b.example.com.'})]
+
+
+def test_records_in_the_way_of_a_cname_are_deleted_first(do, server):
+    for record in (SOA, NS, WWW, {'id': 4, 'type': 'A', 'name': 'api', 'data': '1.1.1.1'}):
+        server.fleet.records[record['id']] = dict(record)
+    desired = [{'type': 'CNAME', 'name': 'www', 'data': 'b.example.com.'},
+               {'type': 'CNAME', 'name': 'api', 'data': 'c.example.com.'}]
+    plan, results, errors = reconcile_records(do, 'example.com', desired)
+    assert not errors
+    records = sorted((record['type'], record['name'], record['data'])
+                     for record in server.fleet.records.values())
+    assert records == [('CNAME', 'api', 'c.example.com.'), ('CNAME', 'www', 'b.example.com.'),
+                       ('NS', '@', 'ns1.digitalocean.com'), ('SOA', '@', '1800')]
@@ -0,0 +1,54 @@
+#coding: utf-8
+import pytest
+
+from dopy.manager import DoError, NotFound
+from dopy.sync import ADDED, REMOVED, UPDATED, InventorySync
+
+
+@pytest.fixture
+def sync(do):
+    sync = InventorySync(do)
+    events = sync.refresh()
+    assert len(events) == len([event for event in events if event.kind == ADDED])
+    return sync
+
+
+def droplet_events(events):
+    return [(event.kind, event.key) for event in events if event.resource_type == 'droplet']
+
+
+def test_incremental_refresh_follows_the_actions(do, server, sync):
+    server.fleet.droplets[1]['name'] = 'renamed'
+    do.reboot_droplet(1)
+    do.destroy_droplet(2)
+    assert sorted(droplet_events(sync.refresh())) == [(REMOVED, 2), (UPDATED, 1)]
+    assert sync.droplets[1]['name'] == 'renamed' and 2 not in sync.droplets
+    assert server.requests[('GET', '/v2/droplets/')] == 1  # the first load only
+
+
+def test_errors_other_than_404_keep_the_droplet(do, server, sync):
+    do.reboot_droplet(1)
+    last_action_id = sync.last_action_id
+    server.errors[('GET', '/v2/droplets/1')] = 500
+    with pytest.raises(DoError):
+        sync.refresh()
+    assert 1 in sync.droplets
+    assert sync.last_action_id == last_action_id
+
+    # The same actions are looked at again once the API recovers.
+    del server.errors[('GET', '/v2/droplets/1')]
+    server.fleet.droplets[1]['name'] = 'renamed'
+    assert droplet_events(sync.refresh()) == [(UPDATED, 1)]
+
+
+def test_tags_are_indexed(do, server, sync):
+    assert sorted(droplet['id'] for droplet in sync.droplets_with_tag('web')) == [2, 4, 6, 8, 10]
+    server.fleet.droplets[2]['tags'] = ['db']
+    do.reboot_droplet(2)
+    sync.refresh()
+    assert 2 not in [droplet['id'] for droplet in sync.droplets_with_tag('web')]
+
+
+def test_missing_droplet_raises_not_found(do):
+    with pytest.raises(NotFound):
+        do.show_droplet(12345)
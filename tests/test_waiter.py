@@ -0,0 +1,49 @@
+#coding: utf-8
+from concurrent.futures import Future
+
+from dopy.manager import DoManager
+from dopy.models import Action
+from dopy.waiter import ActionWaiter, action_id
+
+
+class Manager(object):
+    def show_action(self, id):
+        return {'id': id, 'status': 'completed'}
+
+
+def test_a_future_cancelled_mid_round_does_not_stop_the_poller(monkeypatch):
+    waiter = ActionWaiter(Manager(), interval=0.01)
+    cancelled = Future.cancelled
+    raced = []
+
+    def racy(future):
+        # Cancel right after the poller checked the future wasn't.
+        if not raced and not cancelled(future):
+            raced.append(future.cancel())
+            return False
+        return cancelled(future)
+
+    monkeypatch.setattr(Future, 'cancelled', racy)
+    first = waiter.submit(1)
+    waiter.submit(2).result(timeout=5)
+    monkeypatch.undo()
+
+    assert raced == [True] and first.cancelled()
+    assert waiter.submit(3).result(timeout=5) == {'id': 3, 'status': 'completed'}
+
+
+def test_bulk_scan_matches_string_ids_and_returns_models(server):
+    do = DoManager(None, 'token', 2, api_endpoint=server.endpoint, models=True)
+    ids = [str(do.reboot_droplet(id)['action']['id']) for id in (1, 2, 3, 4, 5, 6)]
+    found = ActionWaiter(do, bulk_threshold=5).fetch_statuses(ids)
+    assert sorted(found) == sorted(ids)
+    assert all(isinstance(action, Action) for action in found.values())
+    assert ('GET', '/v2/actions/1') not in server.requests  # all found by the scan
+
+
+def test_action_models_can_be_waited_on(server):
+    do = DoManager(None, 'token', 2, api_endpoint=server.endpoint, models=True)
+    action = do.assign_floating_ip(sorted(server.fleet.floating_ips)[0], 3)
+    assert isinstance(action, Action)
+    assert action_id(action) == action_id({'action': {'id': action['id']}}) == action['id']
+    assert [done['status'] for done in do.wait_for_actions([action], timeout=5)] == ['completed']